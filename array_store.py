@@ -0,0 +1,131 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# numpy is optional, the object path in scheduler.py is used without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def available():
+    return np is not None
+
+class CharacterArrayStore():
+    """
+    Struct-of-arrays copy of the hot per-character fields, one slot per character,
+    so a game tick is a handful of NumPy operations over the whole population.
+    It can be used in place of MissionScheduler.
+    The Character objects stay the source of truth: the store only holds what's
+    needed to find due missions and roll their rewards, filled in when a mission
+    is scheduled.
+    """
+
+    def __init__(self, capacity = 1024):
+        self._tick = 0
+        self._size = 0 # slots in use, including freed ones
+        self._slots = {} # owner_id: slot
+        self._owners = [] # slot: owner_id
+        self._free = [] # freed slots
+        self._rng = np.random.default_rng()
+
+        self._xp_reward = np.zeros(capacity, np.int32)
+        self._progress = np.zeros(capacity, np.int32) # ticks spent on the current mission
+        self._deadline = np.zeros(capacity, np.int64) # tick the current mission finishes on
+        self._active = np.zeros(capacity, np.bool_) # has a scheduled mission
+
+    def __grow(self):
+        capacity = len(self._xp_reward) * 2
+        for name in ('_xp_reward', '_progress', '_deadline', '_active'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def __get_slot(self, owner_id):
+        slot = self._slots.get(owner_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self._owners[slot] = owner_id
+            else:
+                if self._size == len(self._xp_reward):
+                    self.__grow()
+                slot = self._size
+                self._size += 1
+                self._owners.append(owner_id)
+            self._slots[owner_id] = slot
+        return slot
+
+    def get_tick(self):
+        return self._tick
+
+    def schedule(self, character):
+        """
+        (Re)schedules the character's current mission, taking into account
+        any progress it has already made.
+        """
+        progress = character.get_mission_progress()
+        mission = progress.mission
+        ticks = character._current_mission_ticks
+        slot = self.__get_slot(character._owner_id)
+
+        self._xp_reward[slot] = mission.xp_reward
+        self._progress[slot] = ticks
+        self._deadline[slot] = self._tick + max(1, mission.get_time_required() - ticks)
+        self._active[slot] = True
+        progress.start_tick = self._tick - ticks
+
+    def unschedule(self, character):
+        """Stops tracking the character and frees its slot."""
+        slot = self._slots.pop(character._owner_id, None)
+        if slot is not None:
+            self._active[slot] = False
+            self._owners[slot] = None
+            self._free.append(slot)
+
+    def advance(self):
+        """
+        Advances the clock one tick and returns the owner ids of all
+        characters whose missions are due.
+        """
+        self._tick += 1
+        n = self._size
+        active = self._active[:n]
+        self._progress[:n] += active
+
+        due = np.flatnonzero(active & (self._deadline[:n] <= self._tick))
+        self._active[due] = False
+        owners = self._owners
+        return [owners[slot] for slot in due.tolist()]
+
+    def award_xp(self, owner_ids):
+        """
+        Rolls the variable XP reward of each character's finished mission.
+        Returns the rewards in the same order.
+        """
+        slots = np.fromiter((self._slots[o] for o in owner_ids), np.int64, len(owner_ids))
+        base = self._xp_reward[slots]
+        # same bounds as MissionNode.get_variable_xp_reward
+        rewards = self._rng.integers((base * 0.9).astype(np.int64), (base * 1.1).astype(np.int64) + 1)
+        return rewards.tolist()
+
+    def get_progress_ticks(self, character):
+        """Gets the number of ticks the character has spent on its current mission."""
+        return int(self._progress[self._slots[character._owner_id]])
+
+    def __len__(self):
+        return int(np.count_nonzero(self._active[:self._size]))
@@ -0,0 +1,106 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Benchmarks the memory held by the character roster when every character is
+# a full object against the roster keeping only a capped working set resident.
+# usage: python bench_memory.py [resident cap] [population ...]
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import config
+
+def measure(build):
+    """Returns (what build returned, bytes still allocated by it)."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def main():
+    capacity = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    populations = [int(n) for n in sys.argv[2:]] or [10000, 100000]
+
+    # the models open the configured DB on import, so run against a scratch one
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        config.write(config.Config('', 'bench.db', 10, [], []))
+
+        import database
+        import mapper
+        from character import Character
+        from mission_graph import MissionNode
+        from roster import Roster
+
+        missions = [MissionNode(i, 'mission {}'.format(i), 'description', 'epilogue', 100, 300, 1, None)
+            for i in range(50)]
+        now = int(time.time())
+
+        def make_character(i):
+            c = Character('hero{}'.format(i), str(i))
+            c.id = i + 1
+            c.set_new_mission(missions[i % len(missions)], now)
+            return c
+
+        def all_resident(count):
+            characters = {}
+            for i in range(count):
+                c = make_character(i)
+                characters[c._owner_id] = c
+            mapper.collect_changes()
+            return characters
+
+        def paged(count):
+            roster = Roster(None, capacity)
+            for i in range(count):
+                roster.add(make_character(i))
+            mapper.collect_changes()
+            roster.take_changes()
+            return roster
+
+        print('resident cap {}'.format(capacity))
+        print('{:>10} {:>14} {:>14} {:>10} {:>16}'.format(
+            'characters', 'all MB', 'paged MB', 'saved', 'materialise us'))
+        for count in populations:
+            characters, full = measure(lambda: all_resident(count))
+            del characters
+            roster, compact = measure(lambda: paged(count))
+
+            # a mission completion wakes a dormant character and puts it back to sleep
+            owner_ids = [str(i) for i in range(0, count - capacity)][:10000]
+            start = time.perf_counter()
+            for owner_id in owner_ids:
+                roster.borrow(owner_id)
+            roster.release()
+            wake = (time.perf_counter() - start) * 1e6 / max(1, len(owner_ids))
+            mapper.collect_changes()
+            del roster
+
+            print('{:>10} {:>14.1f} {:>14.1f} {:>9.0f}% {:>16.1f}'.format(count,
+                full / 2 ** 20, compact / 2 ** 20, (1 - compact / full) * 100, wake))
+
+        os.chdir('/')
+
+if __name__ == '__main__':
+    main()
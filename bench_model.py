@@ -0,0 +1,167 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Benchmarks the slotted runtime Character against an ORM-mapped one like the
+# game used before mapper.py: tick and command CPU time and memory per object.
+# usage: python bench_model.py [characters] [rounds]
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+import config
+import level_table
+
+LegacyBase = declarative_base()
+_legacy_dirty = set()
+
+class LegacyCharacter(LegacyBase):
+    """Character as a declarative ORM class, with dirty tracking in the instance dict."""
+    __tablename__ = 'character'
+
+    id = Column(Integer, primary_key = True)
+    _name = Column(String)
+    _owner_id = Column(String)
+    _xp = Column(Integer)
+    _tier = Column(Integer)
+    _credits = Column(Integer)
+    _current_mission_id = Column(Integer)
+    _current_mission_ticks = Column(Integer)
+    _current_mission_started = Column(Integer)
+    _current_ship_id = Column(Integer)
+
+    def __init__(self, name, owner_id):
+        self._name = name
+        self._owner_id = owner_id
+        self._tier = 1
+        self._xp = 0
+        self._level = 0
+        self._credits = 250000
+        self._current_mission_ticks = 0
+        self._current_mission_started = None
+        self._mission_progress = None
+        self._current_ship = None
+        self._signal_level_up = []
+        self._signal_xp_change = []
+        self._signal_mission_complete = []
+
+    def mark_dirty(self, *columns):
+        dirty = self.__dict__.get('_dirty_columns')
+        if dirty is None:
+            dirty = self._dirty_columns = set()
+        dirty.update(columns)
+        _legacy_dirty.add(self)
+        self._version = self.__dict__.get('_version', 0) + 1
+
+    def add_xp(self, xp):
+        self._xp += xp
+        self.mark_dirty('_xp')
+        for signal in self._signal_xp_change:
+            signal(self)
+        level = level_table.get_level(self._xp)
+        if level > self._level:
+            self._level = level
+
+    def get_name(self):
+        return self._name
+
+    def get_xp(self):
+        return self._xp
+
+    def get_level(self):
+        return self._level
+
+    def get_credits(self):
+        return self._credits
+
+    def can_afford(self, amount):
+        return self._credits >= amount
+
+    def subtract_credits(self, amount):
+        if self.can_afford(amount):
+            self._credits -= amount
+            self.mark_dirty('_credits')
+
+    def set_current_ship(self, ship):
+        self._current_ship_id = None if ship is None else ship.id
+        self._current_ship = ship
+        self.mark_dirty('_current_ship_id')
+
+def tick(characters, rounds):
+    # what a mission completion does to a character
+    for _ in range(rounds):
+        for c in characters:
+            c.add_xp(7)
+
+def command(characters, rounds):
+    # reads and writes of a typical !char or !ship buy
+    for _ in range(rounds):
+        for c in characters:
+            c.get_name(), c.get_xp(), c.get_level(), c.get_credits()
+            c.subtract_credits(1)
+            c.set_current_ship(None)
+
+def cpu_ns(work, characters, rounds):
+    start = time.perf_counter()
+    work(characters, rounds)
+    return (time.perf_counter() - start) * 1e9 / (len(characters) * rounds)
+
+def bytes_per_object(make, count):
+    gc.collect()
+    tracemalloc.start()
+    objects = [make(i) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    # the models open the configured DB on import, so run against a scratch one
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        config.write(config.Config('', 'bench.db', 10, [], []))
+
+        import database
+        from character import Character
+        import mapper
+
+        classes = (('orm', LegacyCharacter), ('runtime', Character))
+        print('{} characters, {} rounds'.format(count, rounds))
+        print('{:<8} {:>10} {:>12} {:>14}'.format('class', 'tick ns', 'command ns', 'bytes/object'))
+        for name, cls in classes:
+            characters = [cls('hero{}'.format(i), str(i)) for i in range(count)]
+            tick_ns = cpu_ns(tick, characters, rounds)
+            command_ns = cpu_ns(command, characters, rounds)
+            mapper.collect_changes()
+            _legacy_dirty.clear()
+            del characters
+            size = bytes_per_object(lambda i: cls('hero{}'.format(i), str(i)), count)
+            print('{:<8} {:>10.0f} {:>12.0f} {:>14.0f}'.format(name, tick_ns, command_ns, size))
+
+        os.chdir('/')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Benchmarks commit latency for each storage profile.
+# usage: python bench_storage.py [commits] [rows per commit]
+
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import Column, Integer, MetaData, String, Table
+import storage
+
+def bench_profile(name, commits, rows):
+    metadata = MetaData()
+    table = Table('character', metadata,
+        Column('id', Integer, primary_key = True),
+        Column('_name', String),
+        Column('_xp', Integer))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = storage.create_db_engine(os.path.join(tmp, 'bench.db'), storage.STORAGE_PROFILES[name])
+        metadata.create_all(engine)
+        with engine.connect() as conn:
+            conn.execute(table.insert(), [{'_name': 'c{}'.format(i), '_xp': 0} for i in range(rows)])
+
+            latencies = []
+            for n in range(commits):
+                start = time.perf_counter()
+                with conn.begin():
+                    conn.execute(table.update().values(_xp = table.c._xp + n).where(table.c.id <= rows))
+                latencies.append(time.perf_counter() - start)
+        engine.dispose()
+
+    latencies.sort()
+    return latencies
+
+def main():
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    print('{} commits updating {} rows each'.format(commits, rows))
+    print('{:<8} {:>10} {:>10} {:>10}'.format('profile', 'mean ms', 'p50 ms', 'p99 ms'))
+    for name in sorted(storage.STORAGE_PROFILES):
+        latencies = bench_profile(name, commits, rows)
+        print('{:<8} {:>10.2f} {:>10.2f} {:>10.2f}'.format(name,
+            sum(latencies) * 1000 / len(latencies),
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000))
+
+if __name__ == '__main__':
+    main()
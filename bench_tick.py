@@ -0,0 +1,116 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Benchmarks game ticks per second with the object path (MissionScheduler)
+# against the NumPy array store.
+# usage: python bench_tick.py [ticks] [population ...]
+
+import random
+import sys
+import time
+
+import array_store
+import level_table
+from scheduler import MissionScheduler
+
+# Stand-ins for MissionNode, MissionProgress and Character, which can't be
+# imported without opening the configured database. They do the same work
+# on the tick path.
+class BenchMission():
+    def __init__(self, id, xp_reward, time_required):
+        self.id = id
+        self.xp_reward = xp_reward
+        self.time_required = time_required
+
+    def get_time_required(self):
+        return self.time_required
+
+    def get_variable_xp_reward(self):
+        start = int(self.xp_reward * 0.9)
+        end = int(self.xp_reward * 1.1) + 1
+        return random.randrange(start, end)
+
+class BenchProgress():
+    __slots__ = ('mission', 'start_tick')
+
+    def __init__(self, mission):
+        self.mission = mission
+        self.start_tick = 0
+
+class BenchCharacter():
+    def __init__(self, owner_id, mission):
+        self._owner_id = owner_id
+        self._xp = 0
+        self._level = 1
+        self._credits = 250000
+        self._current_mission_ticks = 0
+        self._mission_progress = BenchProgress(mission)
+
+    def get_mission_progress(self):
+        return self._mission_progress
+
+    def get_xp(self):
+        return self._xp
+
+    def get_level(self):
+        return self._level
+
+    def get_credits(self):
+        return self._credits
+
+    def add_xp(self, xp):
+        self._xp += xp
+        self._level = level_table.get_level(self._xp)
+
+def make_population(count, missions):
+    rng = random.Random(count)
+    return {str(i): BenchCharacter(str(i), rng.choice(missions)) for i in range(count)}
+
+def run_ticks(scheduler, characters, ticks, vectorized):
+    for c in characters.values():
+        scheduler.schedule(c)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        due = scheduler.advance()
+        if vectorized:
+            rewards = scheduler.award_xp(due) if due else []
+        else:
+            rewards = [characters[o].get_mission_progress().mission.get_variable_xp_reward() for o in due]
+        for owner_id, xp in zip(due, rewards):
+            c = characters[owner_id]
+            c.add_xp(xp)
+            scheduler.schedule(c) # same mission again
+    return ticks / (time.perf_counter() - start)
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    populations = [int(n) for n in sys.argv[2:]] or [1000, 10000, 100000]
+    missions = [BenchMission(i, random.randint(50, 500), random.randint(60, 600)) for i in range(50)]
+
+    print('{} ticks per run'.format(ticks))
+    print('{:>10} {:>14} {:>14}'.format('characters', 'objects t/s', 'arrays t/s'))
+    for count in populations:
+        objects = run_ticks(MissionScheduler(), make_population(count, missions), ticks, False)
+        if array_store.available():
+            arrays = '{:>14.1f}'.format(run_ticks(array_store.CharacterArrayStore(), make_population(count, missions), ticks, True))
+        else:
+            arrays = '{:>14}'.format('no numpy')
+        print('{:>10} {:>14.1f} {}'.format(count, objects, arrays))
+
+if __name__ == '__main__':
+    main()
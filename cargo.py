@@ -27,7 +27,7 @@ class Cargo(DbModel):
     id = Column(Integer, primary_key = True)
     _cargo_type = Column(String)
     _mass = Column(Integer)
-    _cargo_hold_id = Column(Integer, ForeignKey('ship.id'))
+    _cargo_hold_id = Column(Integer, ForeignKey('ship.id'), index = True)
 
     __mapper_args__ = {
         'polymorphic_identity':'cargo',
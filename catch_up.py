@@ -0,0 +1,113 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import OrderedDict
+
+class CatchUpSummary():
+    """
+    Everything a character accomplished while the bot was offline.
+    """
+
+    def __init__(self, character):
+        self._character = character
+        self._start_level = character.get_level()
+        self._completed = OrderedDict() # mission name: times completed
+        self._mission_count = 0
+        self._xp = 0
+
+    def add_completed(self, mission, xp):
+        name = mission.get_name()
+        self._completed[name] = self._completed.get(name, 0) + 1
+        self._mission_count += 1
+        self._xp += xp
+
+    def get_mission_count(self):
+        return self._mission_count
+
+    def get_levels_gained(self):
+        return self._character.get_level() - self._start_level
+
+    def get_private_message(self):
+        """Gets the single summary sent to the player."""
+        lines = []
+        lines.append('While you were away you completed {} mission{} and were awarded {} XP!'.format(
+            self._mission_count, '' if self._mission_count == 1 else 's', self._xp))
+        for name, count in self._completed.items():
+            lines.append(' {} x{}'.format(name, count))
+
+        levels = self.get_levels_gained()
+        if levels > 0:
+            lines.append('You gained {} level{} and are now level {}.'.format(
+                levels, '' if levels == 1 else 's', self._character.get_level()))
+
+        lines.append('\nYour current mission:\n{}'.format(self._character.get_current_mission().get_info_card()))
+        return '\n'.join(lines)
+
+    def get_public_message(self):
+        """Gets the level-up announcement, or None if the character didn't level."""
+        levels = self.get_levels_gained()
+        if levels == 0:
+            return None
+        c = self._character
+        return '{} is now level {} ({} XP) after {} level{} gained offline!'.format(
+            c.get_name(), c.get_level(), c.get_xp(), levels, '' if levels == 1 else 's')
+
+def fast_forward(character, mission_control, now):
+    """
+    Completes every mission the character would have finished by the given
+    unix timestamp, one step per mission rather than per tick.
+    Publishes no events, so no per-mission or per-level messages are queued.
+    Returns a CatchUpSummary.
+    """
+    return fast_forward_all([character], mission_control, now)[0]
+
+def fast_forward_all(characters, mission_control, now):
+    """
+    Fast forwards many characters at once. Every round completes one mission for
+    each character that's still behind, so their next missions are chosen in one batch.
+    Returns a CatchUpSummary per character, in the same order.
+    """
+    summaries = [CatchUpSummary(c) for c in characters]
+    behind = [] # (character, summary, current mission's start)
+    for c, summary in zip(characters, summaries):
+        if c.get_current_mission() is None:
+            continue
+        started = c.get_mission_started()
+        if started is None:
+            started = now - c._current_mission_ticks
+        behind.append((c, summary, started))
+
+    while behind:
+        due = []
+        for c, summary, started in behind:
+            mission = c.get_current_mission()
+            # a mission always takes at least a second, or a bad one would never let time pass
+            time_required = max(1, mission.get_time_required())
+            if started + time_required > now:
+                # characters saved before timestamps were recorded get one from here on
+                c.resume_mission(started, now - started)
+                continue
+            xp_gain = mission.get_variable_xp_reward()
+            c.add_xp(xp_gain)
+            summary.add_completed(mission, xp_gain)
+            due.append((c, summary, started + time_required))
+
+        missions = mission_control.generate_missions_for([c for c, _, _ in due])
+        for (c, _, started), mission in zip(due, missions):
+            c.set_new_mission(mission, started)
+        behind = due
+    return summaries
@@ -16,83 +16,83 @@ along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from database import DbModel
-from sqlalchemy import Column, Integer, String, ForeignKey, orm
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey
 
-from mission import Mission
+import level_table
+import mapper
+from mission_graph import MissionProgress
 
-def calc_level(xp):
-    level = int((xp / float(100)) ** (1/1.5)) + 1
-    return level
-
-class Character(DbModel):
+class CharacterRow(DbModel):
+    """
+    Stored form of a Character, only used by queries and the persistence worker.
+    """
     __tablename__ = 'character'
 
     id = Column(Integer, primary_key = True)
     _name = Column(String)
-    _owner_id = Column(String) # Discord User ID
+    _owner_id = Column(String, index = True, unique = True) # Discord User ID
     _xp = Column(Integer)
     _tier = Column(Integer)
     _credits = Column(Integer)
     _current_mission_id = Column(Integer, ForeignKey('mission.id'))
-    _current_mission = relationship('Mission')
     _current_mission_ticks = Column(Integer)
+    _current_mission_started = Column(Integer) # unix timestamp
     _current_ship_id = Column(Integer, ForeignKey('ship.id'))
-    _current_ship = relationship('Ship', lazy='joined')
+
+class Character(mapper.RuntimeModel):
+    __slots__ = ('id', '_name', '_owner_id', '_xp', '_tier', '_credits', '_current_mission_id',
+        '_current_mission_ticks', '_current_mission_started', '_current_ship_id',
+        '_level', '_mission_progress', '_current_ship')
 
     def __init__(self, name, owner_id):
+        self.id = None
         self._name = name
         self._owner_id = owner_id
         self._tier = 1
         self._xp = 0
         self._level = 0
         self._credits = 250000 # this may need to be a config value
+        self._current_mission_id = None
         self._current_mission_ticks = 0
-        self._current_mission = None
+        self._current_mission_started = None
+        self._current_ship_id = None
+        self._mission_progress = None
         self._current_ship = None
-        self._signal_level_up = []
-        self._signal_mission_complete = []
 
-    @orm.reconstructor
     def init_on_load(self):
-        self._level = calc_level(self._xp)
-        self._signal_level_up = []
-        self._signal_mission_complete = []
-        if self._current_mission_id is None:
-            self._current_mission = None
-        else:
-            self._current_mission.set_progress_ticks(self._current_mission_ticks)
-            self._current_mission.connect_complete(self.__mission_complete)
+        self._level = level_table.get_level(self._xp)
+        self._mission_progress = None # see resolve_mission
+        self._current_ship = None # loaded by the hangar
 
     def __repr__(self):
         return '<Character(name = {}, xp = {}, owner_id = {})>'.format(
             self._name, self._xp, self._owner_id)
 
     def add_xp(self, xp):
-        """Adds xp to this character."""
+        """Adds xp to this character. Returns the number of levels gained."""
         self._xp += xp
-        level = calc_level(self._xp)
+        self.mark_dirty('_xp')
+        level = level_table.get_level(self._xp)
 
-        if level > self._level:
-            # account for possible multi-level-up
-            for _ in range(self._level, level):
-                self._level += 1
-                for signal in self._signal_level_up:
-                    signal(self)
+        gained = max(0, level - self._level)
+        self._level += gained
+        return gained
 
-    def connect_level_up(self, func):
+    @staticmethod
+    def add_xp_batch(characters, gains):
         """
-        Connects a callback that will be called when this character
-        gains a level. This character is passed as the argument.
+        Adds each XP gain to the matching character. A character may only appear once.
+        Returns (character, levels gained) for the characters that levelled up.
         """
-        self._signal_level_up.append(func)
+        levels = [c._level for c in characters]
+        for c, xp in zip(characters, gains):
+            c._xp += xp
+            c.mark_dirty('_xp')
 
-    def connect_mission_complete(self, func):
-        """
-        Connects a callback that will be called when this character
-        completes its current mission. This character is passed as the argument.
-        """
-        self._signal_mission_complete.append(func)
+        level_ups = level_table.get_level_ups(levels, [c._xp for c in characters])
+        for i, gained in level_ups:
+            characters[i]._level += gained
+        return [(characters[i], gained) for i, gained in level_ups]
 
     def get_level(self):
         return self._level
@@ -103,24 +103,62 @@ class Character(DbModel):
     def get_name(self):
         return self._name
 
-    def set_new_mission(self, mission):
+    def get_tier(self):
+        return self._tier
+
+    def set_new_mission(self, mission, started):
+        """Starts the given mission at the given unix timestamp."""
+        self._mission_progress = MissionProgress(mission, started)
         self._current_mission_id = mission.id
-        self._current_mission = mission
         self._current_mission_ticks = 0
-        mission.connect_complete(self.__mission_complete)
+        self._current_mission_started = started
+        self.mark_dirty('_current_mission_id', '_current_mission_ticks', '_current_mission_started')
 
     def set_current_ship(self, ship):
         self._current_ship_id = None if ship is None else ship.id
         self._current_ship = ship
+        self.mark_dirty('_current_ship_id')
 
     def get_current_ship(self):
         return self._current_ship
 
-    def run_current_mission(self):
-        self._current_mission.run()
+    def resolve_mission(self, mission_graph):
+        """
+        Looks up the stored mission id in the mission graph after loading.
+        The character is left without a mission if it no longer exists.
+        """
+        mission = None
+        if self._current_mission_id is not None:
+            mission = mission_graph.get(self._current_mission_id)
+        self._mission_progress = None if mission is None else MissionProgress(mission, self._current_mission_started)
+
+    def rebind_mission(self, mission_graph):
+        """
+        Points the current mission at its node in a reloaded mission graph, keeping progress.
+        Returns False if the mission was removed, in which case the old node is kept
+        so the mission can still be finished.
+        """
+        return self._mission_progress is None or self._mission_progress.rebind(mission_graph)
+
+    def resume_mission(self, started, ticks):
+        """Re-anchors the current mission to the given start timestamp and tick progress."""
+        self._mission_progress.started = started
+        self._current_mission_started = started
+        self._current_mission_ticks = ticks
+        self.mark_dirty('_current_mission_ticks', '_current_mission_started')
 
     def get_current_mission(self):
-        return self._current_mission
+        return None if self._mission_progress is None else self._mission_progress.mission
+
+    def get_mission_progress(self):
+        return self._mission_progress
+
+    def get_mission_started(self):
+        """
+        Gets the unix timestamp the current mission was started at.
+        Characters saved before timestamps were recorded only know their tick progress.
+        """
+        return self._mission_progress.started
 
     def can_afford(self, amount):
         return self._credits >= amount
@@ -131,29 +169,25 @@ class Character(DbModel):
     def subtract_credits(self, amount):
         if self.can_afford(amount):
             self._credits -= amount
+            self.mark_dirty('_credits')
         else:
             raise Exception('{} has {} and can\'t pay {}. Call can_afford()'.format(
                 self._name, self._credits, amount))
 
     def add_credits(self, amount):
         self._credits += amount
+        self.mark_dirty('_credits')
 
-    def get_info_card(self):
+    def get_info_card(self, progress_ticks):
         lines = []
         lines.append('Name:             {}'.format(self._name))
         lines.append('Level:            {}'.format(self._level))
         lines.append('XP:               {}'.format(self._xp))
         lines.append('Credits:          {}'.format(self._credits))
-        m = self._current_mission
-        lines.append('Current mission:  {} ({}%)'.format(m.get_name(), m.get_progress_percent()))
+        m = self.get_current_mission()
+        lines.append('Current mission:  {} ({}%)'.format(m.get_name(), m.get_progress_percent(progress_ticks)))
         if self._current_ship is not None:
             lines.append('Currently aboard your ship \'{}\''.format(self._current_ship.get_name()))
         return '\n'.join(lines)
 
-    def save(self, db):
-        self._current_mission_ticks = self._current_mission.get_progress_ticks()
-        super().save(db)
-
-    def __mission_complete(self, mission):
-        for signal in self._signal_mission_complete:
-            signal(self)
+mapper.register(Character, CharacterRow)
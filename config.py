@@ -27,6 +27,37 @@ def write(config):
 
 class Config(object):
     """GrindBot config data model"""
+
+    # defaults for settings that older config files don't have
+    tick_overrun_policy = 'catch_up' # 'catch_up' or 'skip'
+    db_profile = 'wal' # see storage.STORAGE_PROFILES
+    db_journal_mode = None # None uses the profile's setting
+    db_synchronous = None
+    db_cache_size = None
+    db_mmap_size = None
+    db_busy_timeout = None
+    db_pool_size = 5
+    db_max_overflow = 10
+    tick_max_catch_up = 60
+    dispatch_workers = 4
+    dispatch_queue_size = 1000
+    dispatch_max_retries = 5
+    dispatch_close_timeout = 10 # seconds to wait for queued messages on unload
+    coalesce_public_window = 5 # seconds
+    coalesce_private_window = 2
+    resolve_cache_size = 10000
+    resolve_cache_ttl = 3600 # seconds
+    resolve_negative_ttl = 300
+    content_watch_interval = 0 # seconds between content file checks, 0 disables
+    content_reload_chunk = 500 # characters moved to reloaded missions per loop iteration
+    scoreboard_page_size = 20
+    snapshot_file = 'world.snap' # None disables world snapshots
+    snapshot_wait = 600 # game ticks between snapshots, 0 only writes one on shutdown
+    use_array_store = False # tick characters with numpy, see array_store.py
+    resident_characters = 1000 # characters kept as full objects, see roster.py
+    mission_paths = ['missions.json'] # mission json files, and directories of them
+    mission_sync_batch = 500 # missions upserted per statement when syncing
+
     def __init__(self, token, db_file, db_commit_wait, admins, channel_ids):
         object.__init__(self)
         self.token = token
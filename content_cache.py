@@ -0,0 +1,281 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Compiles the content json files into validated rows and caches them in a
+# compact binary form, so boots after the first don't decode any json.
+# Missions can run to many files and are streamed instead, see iter_missions.
+# usage: python content_cache.py  (prebuilds the cache for every content file)
+
+import hashlib
+import json
+import marshal
+import os
+import sys
+
+# bump when the compiled row layout changes
+FORMAT_VERSION = 2
+
+CACHE_DIR = '.content_cache'
+
+# content schemas as (field, type) in row order, or (field, type, default) for optional fields
+SCHEMAS = {
+    'ships': (('model', str), ('cost', int), ('mass', int), ('cargo_capacity', int),
+        ('fuel_capacity', int), ('weapon_hardpoints', int), ('aux_hardpoints', int),
+        ('description', str)),
+    'weapons': (('name', str), ('description', str), ('base_damage_dice', str)),
+    'missions': (('name', str), ('description', str), ('epilogue', str), ('xp_reward', int),
+        ('time_required', int), ('tier', int), ('weight', float, 1.0)),
+}
+
+# cached content files by kind
+CONTENT_FILES = {
+    'ships': 'ships.json',
+    'weapons': 'weapons.json',
+}
+
+# mission fields that must fall in a range, as (field, lowest value, whether the lowest is allowed)
+_MISSION_LIMITS = tuple((field, [f for f, *_ in SCHEMAS['missions']].index(field), lowest, inclusive)
+    for field, lowest, inclusive in (('xp_reward', 0, True), ('time_required', 0, False), ('weight', 0, True)))
+
+class ContentError(ValueError):
+    """Raised when a content file doesn't match its schema."""
+    pass
+
+def hash_file(path):
+    """Gets the sha256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def get_columns(kind):
+    """Gets the column attributes that a compiled row of the given kind maps to."""
+    columns = ['_' + field for field, *_ in SCHEMAS[kind]]
+    if kind == 'missions':
+        columns.append('_parent_name')
+    return columns
+
+def validate(kind, entry, where):
+    """Checks a decoded json entry against its schema and returns its values in row order."""
+    if not isinstance(entry, dict):
+        raise ContentError('{}: expected an object'.format(where))
+
+    values = []
+    for field, field_type, *default in SCHEMAS[kind]:
+        if field not in entry:
+            if default:
+                values.append(default[0])
+                continue
+            raise ContentError('{}: missing field \'{}\''.format(where, field))
+        value = entry[field]
+        if field_type is float and isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        # bools are ints as far as isinstance is concerned
+        if not isinstance(value, field_type) or isinstance(value, bool):
+            raise ContentError('{}: \'{}\' should be {}, not {}'.format(
+                where, field, field_type.__name__, type(value).__name__))
+        values.append(value)
+    return values
+
+def compile_missions(entries, where, parent_name = None, rows = None):
+    """Flattens a mission tree into rows that name their parent, parents before children."""
+    if rows is None:
+        rows = []
+    if not isinstance(entries, list):
+        raise ContentError('{}: expected a list of missions'.format(where))
+
+    for i, entry in enumerate(entries):
+        compile_mission(entry, '{}[{}]'.format(where, i), parent_name, rows)
+    return rows
+
+def compile_mission(entry, where, parent_name = None, rows = None):
+    """Flattens a single mission and its branches into rows, like compile_missions."""
+    if rows is None:
+        rows = []
+    values = validate('missions', entry, where)
+    for field, index, lowest, inclusive in _MISSION_LIMITS:
+        value = values[index]
+        if value < lowest or (value == lowest and not inclusive):
+            raise ContentError('{}: \'{}\' must be {} {}, not {}'.format(
+                where, field, 'at least' if inclusive else 'more than', lowest, value))
+    values.append(parent_name)
+    rows.append(tuple(values))
+    compile_missions(entry.get('branches', []), where + '.branches', entry['name'], rows)
+    return rows
+
+def iter_json_array(path, chunk_size = 65536):
+    """
+    Decodes the elements of a file that holds a json array one at a time, so only
+    the element being decoded and a chunk of the file are ever in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buffer = ''
+        pos = 0
+
+        def peek():
+            # skips whitespace, reading on as needed. Returns '' at the end of the file
+            nonlocal buffer, pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                buffer = f.read(chunk_size)
+                pos = 0
+                if not buffer:
+                    return ''
+
+        if peek() != '[':
+            raise ContentError('{}: expected a list'.format(path))
+        pos += 1
+        if peek() == ']':
+            pos += 1
+        else:
+            index = 0
+            while True:
+                peek() # raw_decode doesn't skip leading whitespace
+                while True:
+                    try:
+                        value, end = decoder.raw_decode(buffer, pos)
+                    except json.JSONDecodeError as e:
+                        end = None
+                        error = e
+                    # an element that runs to the end of the buffer may continue in the file,
+                    # read at least as much again so long elements are decoded in linear time
+                    if end is not None and end < len(buffer):
+                        break
+                    chunk = f.read(max(chunk_size, len(buffer) - pos))
+                    if not chunk:
+                        if end is None:
+                            raise ContentError('{}[{}]: {}'.format(path, index, error.msg))
+                        break
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+
+                pos = end
+                yield value
+                index += 1
+
+                c = peek()
+                pos += 1
+                if c == ']':
+                    break
+                if c != ',':
+                    raise ContentError('{}: expected \',\' or \']\' after element {}'.format(path, index - 1))
+
+        if peek() != '':
+            raise ContentError('{}: unexpected data after the list'.format(path))
+
+def find_content_files(paths):
+    """Expands a list of files and directories into the json files they hold, in a stable order."""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        found = []
+        for root, _, names in os.walk(path):
+            found += [os.path.join(root, n) for n in names if n.endswith('.json')]
+        files += sorted(found)
+    return files
+
+def hash_files(files):
+    """Gets a sha256 hex digest that changes when any of the files, or the list of them, changes."""
+    h = hashlib.sha256()
+    for path in files:
+        h.update(path.encode())
+        h.update(hash_file(path).encode())
+    return h.hexdigest()
+
+def iter_missions(files):
+    """
+    Streams the compiled rows of every mission in the given files, parents before
+    children. Each top level mission is decoded, compiled and released in turn.
+    """
+    for path in files:
+        for i, entry in enumerate(iter_json_array(path)):
+            yield from compile_mission(entry, '{}[{}]'.format(path, i))
+
+def compile_file(kind, path):
+    """Decodes and validates a content file into a tuple of row tuples."""
+    with open(path, 'r') as f:
+        entries = json.load(f)
+
+    if not isinstance(entries, list):
+        raise ContentError('{}: expected a list'.format(path))
+    return tuple(tuple(validate(kind, e, '{}[{}]'.format(path, i))) for i, e in enumerate(entries))
+
+def get_cache_path(path):
+    return os.path.join(CACHE_DIR, os.path.basename(path) + '.bin')
+
+def read_cache(path):
+    """Reads a compiled cache entry. Returns (mtime_ns, size, digest, rows) or None."""
+    try:
+        with open(get_cache_path(path), 'rb') as f:
+            version, mtime_ns, size, digest, rows = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if version != FORMAT_VERSION:
+        return None
+    return mtime_ns, size, digest, rows
+
+def write_cache(path, mtime_ns, size, digest, rows):
+    os.makedirs(CACHE_DIR, exist_ok = True)
+    cache_path = get_cache_path(path)
+    # write then rename so a crash never leaves a truncated cache behind
+    with open(cache_path + '.tmp', 'wb') as f:
+        marshal.dump((FORMAT_VERSION, mtime_ns, size, digest, rows), f)
+    os.replace(cache_path + '.tmp', cache_path)
+
+def load(kind, path):
+    """
+    Gets (digest, rows) for a content file, compiling it only when the cached copy
+    is stale. A cache entry is trusted as is while the file's mtime and size
+    are unchanged, and is revalidated by hash otherwise.
+    """
+    stat = os.stat(path)
+    cached = read_cache(path)
+
+    if cached is not None:
+        mtime_ns, size, digest, rows = cached
+        if mtime_ns == stat.st_mtime_ns and size == stat.st_size:
+            return digest, rows
+
+        if hash_file(path) == digest:
+            # touched but not changed
+            write_cache(path, stat.st_mtime_ns, stat.st_size, digest, rows)
+            return digest, rows
+
+    digest = hash_file(path)
+    rows = compile_file(kind, path)
+    write_cache(path, stat.st_mtime_ns, stat.st_size, digest, rows)
+    return digest, rows
+
+def main():
+    for kind, path in sorted(CONTENT_FILES.items()):
+        try:
+            digest, rows = load(kind, path)
+        except (OSError, ValueError) as e:
+            print('Unable to compile {}: {}'.format(path, e))
+            return 1
+        print('{}: {} rows ({})'.format(path, len(rows), digest[:12]))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import os
+
+import content_cache
+import content_sync
+import database
+from mission_graph import MissionGraph
+
+class ContentReloader():
+    """
+    Applies changes to the content files to the DB and the running game without
+    a restart. Parsing and DB work run in an executor, and characters are moved
+    onto the new mission graph a chunk at a time, so the game loop keeps ticking.
+    """
+
+    def __init__(self, loop, hangar, mission_control, render_cache, get_characters, chunk_size = 500):
+        self._loop = loop
+        self._hangar = hangar
+        self._mission_control = mission_control
+        self._render_cache = render_cache
+        self._get_characters = get_characters # returns the live characters
+        self._chunk_size = max(1, chunk_size)
+        self._lock = asyncio.Lock()
+        self._file_stats = self.__stat_files()
+
+    def __stat_files(self):
+        stats = {}
+        paths = list(content_cache.CONTENT_FILES.values()) + self._mission_control.get_mission_files()
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stats[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stats[path] = None
+        return stats
+
+    def __sync(self, force):
+        """
+        Syncs every content file into the DB and loads the new mission graph if
+        missions changed, then commits it all at once. Runs in an executor, so it
+        uses its own session. Returns (results, graph or None).
+        """
+        # validate everything first so a bad file can't leave a partial sync behind
+        for kind, path in content_cache.CONTENT_FILES.items():
+            content_cache.load(kind, path)
+
+        session = database.Session()
+        try:
+            # missions are streamed, so they're validated as they're synced. Nothing,
+            # the hashes included, is committed until every file has synced and the
+            # new graph has loaded, so a failure leaves the DB as it was
+            missions = self._mission_control.sync_missions(force, session, commit = False)
+            results = [
+                content_sync.sync_ship_blueprints(content_cache.CONTENT_FILES['ships'], force, session, commit = False),
+                content_sync.sync_weapon_blueprints(content_cache.CONTENT_FILES['weapons'], force, session, commit = False),
+                missions,
+            ]
+
+            graph = None
+            if not results[2].skipped:
+                graph = MissionGraph.load(session)
+            session.commit()
+            return results, graph
+        except:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def reload(self, force = False):
+        """
+        Reloads the content files, applying only what changed unless forced.
+        Returns a report of what was done.
+        """
+        async with self._lock:
+            self._file_stats = self.__stat_files()
+            results, graph = await self._loop.run_in_executor(None, self.__sync, force)
+
+            lines = [str(r) for r in results]
+            if not results[0].skipped:
+                self._hangar.refresh_ship_blueprints()
+                self._render_cache.prerender_blueprints(self._hangar.get_ship_blueprints())
+
+            if graph is not None:
+                self._mission_control.set_mission_graph(graph)
+                self._render_cache.prerender_missions(graph)
+                rebound, kept = await self.__rebind_characters(graph)
+                lines.append('Moved {} characters onto the new mission graph ({} on removed missions).'.format(
+                    rebound, kept))
+            return '\n'.join(lines)
+
+    async def __rebind_characters(self, graph):
+        """
+        Points every character's mission progress at the reloaded mission nodes,
+        yielding to the game loop between chunks. Returns (characters, kept old node).
+        """
+        characters = list(self._get_characters())
+        kept = 0
+        for i, c in enumerate(characters):
+            if not c.rebind_mission(graph):
+                kept += 1
+            if (i + 1) % self._chunk_size == 0:
+                await asyncio.sleep(0)
+        return len(characters), kept
+
+    async def watch(self, interval):
+        """Polls the content files every interval seconds and reloads them when they change."""
+        while True:
+            await asyncio.sleep(interval)
+            if self.__stat_files() == self._file_stats:
+                continue
+
+            try:
+                print(await self.reload())
+            except Exception as e:
+                # keep the content that's loaded until the file is fixed or the DB
+                # is free again, and keep watching
+                print('Content reload failed: {}'.format(e))
@@ -0,0 +1,232 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+
+import content_cache
+from database import DbModel
+import database
+from mission import Mission
+from ship import ShipRow, ShipBlueprint
+from sqlalchemy import Column, String, bindparam
+from weapon import Weapon, WeaponBlueprint
+
+class ContentVersion(DbModel):
+    """
+    Hash of the content file that the DB was last synced from
+    """
+    __tablename__ = 'content_version'
+
+    _name = Column(String, primary_key = True)
+    _hash = Column(String)
+
+class SyncResult():
+    """What a content sync changed and how long each phase took."""
+
+    def __init__(self, name):
+        self.name = name
+        self.skipped = False
+        self.inserted = 0
+        self.updated = 0
+        self.removed = 0
+        self.timings = [] # (phase, seconds)
+
+    def __str__(self):
+        phases = ', '.join('{} {:.1f} ms'.format(p, t * 1000) for p, t in self.timings)
+        if self.skipped:
+            return '{} unchanged, sync skipped ({})'.format(self.name, phases)
+        return '{} synced: {} inserted, {} updated, {} removed ({})'.format(
+            self.name, self.inserted, self.updated, self.removed, phases)
+
+def sync_file(name, path, apply_diff, force = False, session = None, commit = True):
+    """
+    Syncs a content file into the DB unless its hash matches the one recorded at the
+    last sync. The file is loaded through the content cache, and apply_diff(session, rows, result)
+    applies the differences with bulk statements. Everything is committed in one
+    transaction, on the given session or the global one, unless commit is False and
+    the caller commits it. Returns a SyncResult.
+    """
+    if session is None:
+        session = database.session
+    result = SyncResult(name)
+
+    start = time.perf_counter()
+    digest, rows = content_cache.load(name, path)
+    result.timings.append(('load', time.perf_counter() - start))
+
+    version = session.query(ContentVersion).get(name)
+    if not force and version is not None and version._hash == digest:
+        result.skipped = True
+        return result
+
+    start = time.perf_counter()
+    columns = content_cache.get_columns(name)
+    apply_diff(session, [dict(zip(columns, r)) for r in rows], result)
+    result.timings.append(('diff', time.perf_counter() - start))
+
+    if version is None:
+        session.add(ContentVersion(_name = name, _hash = digest))
+    else:
+        version._hash = digest
+    if commit:
+        start = time.perf_counter()
+        session.commit()
+        result.timings.append(('commit', time.perf_counter() - start))
+
+    return result
+
+def diff_rows(session, model, key, columns, rows, protected_ids = (), partial = False):
+    """
+    Diffs content rows against every row of a model, matched on the key column attribute.
+    Only the given column attributes are compared and loaded.
+    Returns (inserts, updates, removed ids). Rows whose id is protected are never removed.
+    With partial, rows are only part of the content: just the DB rows they match
+    are loaded, and nothing is removed.
+    """
+    query = session.query(model.id, *[getattr(model, c) for c in columns])
+    if partial:
+        # an expanding parameter is much cheaper to build than one literal per key
+        query = query.filter(getattr(model, key).in_(bindparam('keys', expanding = True))).params(
+            keys = [row[key] for row in rows])
+
+    existing = {}
+    for r in query:
+        values = dict(zip(columns, r[1:]))
+        existing[values[key]] = (r[0], values)
+
+    inserts = []
+    updates = []
+    for row in rows:
+        current = existing.pop(row[key], None)
+        if current is None:
+            inserts.append(row)
+        elif current[1] != row:
+            update = dict(row)
+            update['id'] = current[0]
+            updates.append(update)
+
+    removed = [] if partial else [id for id, _ in existing.values() if id not in protected_ids]
+    return inserts, updates, removed
+
+def apply_rows(session, model, inserts, updates, removed, result):
+    """Applies a diff with one bulk statement per kind of change."""
+    if inserts:
+        session.bulk_insert_mappings(model, inserts)
+    if updates:
+        session.bulk_update_mappings(model, updates)
+    if removed:
+        session.query(model).filter(model.id.in_(removed)).delete(synchronize_session = False)
+
+    result.inserted += len(inserts)
+    result.updated += len(updates)
+    result.removed += len(removed)
+
+def sync_ship_blueprints(path, force = False, session = None, commit = True):
+    def apply_diff(session, rows, result):
+        # blueprints of ships that players own can't be removed
+        owned = set(id for (id,) in session.query(ShipRow._blueprint_id).distinct())
+        columns = content_cache.get_columns('ships')
+        apply_rows(session, ShipBlueprint, *diff_rows(session, ShipBlueprint, '_model', columns, rows, owned), result)
+
+    return sync_file('ships', path, apply_diff, force, session, commit)
+
+def sync_weapon_blueprints(path, force = False, session = None, commit = True):
+    def apply_diff(session, rows, result):
+        owned = set(id for (id,) in session.query(Weapon._blueprint_id).distinct())
+        columns = content_cache.get_columns('weapons')
+        apply_rows(session, WeaponBlueprint, *diff_rows(session, WeaponBlueprint, '_name', columns, rows, owned), result)
+
+    return sync_file('weapons', path, apply_diff, force, session, commit)
+
+def sync_missions(paths, force = False, batch_size = 500, session = None, commit = True):
+    """
+    Syncs the missions in the given files and directories into the DB unless none of
+    them changed since the last sync. The files are streamed and missions are upserted
+    batch_size at a time, so only the name and id of every mission are held in memory
+    rather than the whole catalog. Everything is committed in one transaction, on the
+    given session or the global one, unless commit is False and the caller commits it.
+    Returns a SyncResult.
+    """
+    if session is None:
+        session = database.session
+    result = SyncResult('missions')
+    # every row of a batch is looked up by name, and SQLite allows 999 variables a statement
+    batch_size = max(1, min(batch_size, 500))
+
+    start = time.perf_counter()
+    files = content_cache.find_content_files(paths)
+    digest = content_cache.hash_files(files)
+    result.timings.append(('hash', time.perf_counter() - start))
+
+    version = session.query(ContentVersion).get('missions')
+    if not force and version is not None and version._hash == digest:
+        result.skipped = True
+        return result
+
+    start = time.perf_counter()
+    # new missions are given ids as they're read so their children can refer
+    # to them without a round trip per row
+    ids = dict(session.query(Mission._name, Mission.id))
+    next_id = (max(ids.values()) if ids else 0) + 1
+    names = content_cache.get_columns('missions')
+    columns = list(names)
+    columns[columns.index('_parent_name')] = '_parent_id'
+
+    seen = set()
+    batch = []
+    for values in content_cache.iter_missions(files):
+        row = dict(zip(names, values))
+        name = row['_name']
+        if name in seen:
+            raise content_cache.ContentError('mission \'{}\' is defined more than once'.format(name))
+        seen.add(name)
+        if name not in ids:
+            ids[name] = next_id
+            next_id += 1
+        parent = row.pop('_parent_name')
+        row['_parent_id'] = None if parent is None else ids[parent]
+
+        batch.append(row)
+        if len(batch) == batch_size:
+            apply_mission_batch(session, batch, columns, ids, result)
+            batch = []
+    apply_mission_batch(session, batch, columns, ids, result)
+
+    removed = [id for name, id in ids.items() if name not in seen]
+    for i in range(0, len(removed), batch_size):
+        apply_rows(session, Mission, [], [], removed[i:i + batch_size], result)
+    result.timings.append(('sync', time.perf_counter() - start))
+
+    if version is None:
+        session.add(ContentVersion(_name = 'missions', _hash = digest))
+    else:
+        version._hash = digest
+    if commit:
+        start = time.perf_counter()
+        session.commit()
+        result.timings.append(('commit', time.perf_counter() - start))
+
+    return result
+
+def apply_mission_batch(session, rows, columns, ids, result):
+    """Diffs a batch of mission rows against the DB rows with the same names and applies the changes."""
+    if not rows:
+        return
+    inserts, updates, _ = diff_rows(session, Mission, '_name', columns, rows, partial = True)
+    for row in inserts:
+        row['id'] = ids[row['_name']]
+    apply_rows(session, Mission, inserts, updates, [], result)
@@ -16,46 +16,96 @@ along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import config
-from sqlalchemy import create_engine, orm
+from sqlalchemy import exc, inspect, orm
 from sqlalchemy.ext.declarative import declarative_base
+import storage
 
 DbModel = declarative_base()
 
 # Database models
-from character import Character
+from character import CharacterRow
 from mission import Mission
-from ship import Ship
+from ship import ShipRow, ShipBlueprint
 from weapon import WeaponBlueprint
+from content_sync import ContentVersion
+from persistence import SaveMark
 
 _config = config.get()
 
-def _save(self, session):
-    session.merge(self)
-
-DbModel.save = _save
-
 # init
-_db_engine = create_engine('sqlite:///{}'.format(_config.db_file), echo = False)
+_storage_profile = storage.get_storage_profile(_config)
+_db_engine = storage.create_db_engine(_config.db_file, _storage_profile,
+    pool_size = int(_config.db_pool_size), max_overflow = int(_config.db_max_overflow))
 DbModel.metadata.create_all(_db_engine, checkfirst = True)
 
+def _add_missing_columns(engine):
+    """
+    Adds columns that were introduced after a table was first created,
+    since create_all only creates missing tables.
+    """
+    inspector = inspect(engine)
+    for table in DbModel.metadata.sorted_tables:
+        existing = set(c['name'] for c in inspector.get_columns(table.name))
+        for column in table.columns:
+            if column.name not in existing:
+                print('Adding column {}.{}'.format(table.name, column.name))
+                engine.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table.name, column.name, column.type.compile(engine.dialect)))
+
+def _add_missing_indexes(engine):
+    """
+    Creates indexes that were introduced after a table was first created.
+    Unique indexes can't be created while the table holds duplicates, so those
+    are reported and skipped until the duplicates are cleaned up.
+    """
+    inspector = inspect(engine)
+    for table in DbModel.metadata.sorted_tables:
+        existing = set(i['name'] for i in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                print('Adding index {}'.format(index.name))
+                try:
+                    index.create(engine)
+                except exc.IntegrityError as e:
+                    print('Unable to create index {}: {}'.format(index.name, e.orig))
+
+_add_missing_columns(_db_engine)
+_add_missing_indexes(_db_engine)
+
 Session = orm.sessionmaker(bind = _db_engine, expire_on_commit = False)
 
 # global DB
 session = Session()
 
-def update_db_weapon_blueprints(weapons):
+# read-only connection for command queries, so they don't contend with saves
+_read_engine = storage.create_db_engine(_config.db_file, _storage_profile,
+    pool_size = 1, max_overflow = 0, read_only = True)
+ReadSession = orm.sessionmaker(bind = _read_engine, expire_on_commit = False)
+read_session = ReadSession()
+
+def explain_query_plan(query):
+    """Gets SQLite's query plan for an ORM query as a list of plan steps."""
+    statement = query.statement.compile(dialect = _db_engine.dialect, compile_kwargs = {'literal_binds': True})
+    return [row[-1] for row in _db_engine.execute('EXPLAIN QUERY PLAN {}'.format(statement))]
+
+def check_query_plans():
     """
-    Updates the DB with weapon blueprints read from the weapons json file
+    Checks that the hot lookups are served by indexes.
+    Returns a list of (query name, plan step) for every full table scan.
     """
-    for weapon in weapons:
-        try:
-            # update existing weapons
-            db_blueprint = session.query(WeaponBlueprint).filter(WeaponBlueprint._name == weapon.name).one()
-            db_blueprint.update_data(weapon)
-        except orm.exc.NoResultFound:
-            # add new ship
-            db_weapon = WeaponBlueprint(weapon)
-            session.add(db_weapon)
-    session.commit()
-    print('Weapons loaded.')
-    
\ No newline at end of file
+    hot_queries = {
+        'owned ships': session.query(ShipRow).filter(ShipRow._owner_id == '0'),
+        'root missions': session.query(Mission).filter(Mission._parent_id == None),
+        'mission by name': session.query(Mission).filter(Mission._name == ''),
+        'ship blueprint by model': session.query(ShipBlueprint).filter(ShipBlueprint._model == ''),
+        'weapon blueprint by name': session.query(WeaponBlueprint).filter(WeaponBlueprint._name == ''),
+        'character by owner': session.query(CharacterRow).filter(CharacterRow._owner_id == '0'),
+    }
+
+    scans = []
+    for name, query in hot_queries.items():
+        for step in explain_query_plan(query):
+            # indexed lookups are reported as SEARCH, full table or index scans as SCAN
+            if step.startswith('SCAN'):
+                scans.append((name, step))
+    return scans
@@ -22,22 +22,78 @@ from discord.ext import commands
 
 _config = config.get()
 
+# Discord rejects messages longer than this
+MAX_MESSAGE_LENGTH = 2000
+
 def pretty_print(message):
     return '```\n{}\n```'.format(message)
 
-async def public(bot, message):
-    """Sends the message to the configured bot output channels"""
-    for cid in _config.channel_ids:
-        channel = bot.get_channel(cid)
+_pretty_print_overhead = len(pretty_print(''))
+
+def pack(messages, limit = MAX_MESSAGE_LENGTH):
+    """
+    Packs a list of messages into as few pretty printed payloads as possible,
+    splitting on line boundaries so that no payload is longer than the limit.
+    Lines that are too long on their own are split wherever they need to be.
+    """
+    size = limit - _pretty_print_overhead
+    payloads = []
+    lines = []
+    length = 0
+
+    for message in messages:
+        for line in message.split('\n'):
+            if len(line) > size:
+                if lines:
+                    payloads.append('\n'.join(lines))
+                    lines = []
+                    length = 0
+                while len(line) > size:
+                    payloads.append(line[:size])
+                    line = line[size:]
+
+            # account for the newline that joins this line to the previous one
+            added = len(line) + (1 if lines else 0)
+            if length + added > size:
+                payloads.append('\n'.join(lines))
+                lines = []
+                added = len(line)
+                length = 0
+            lines.append(line)
+            length += added
 
-        if channel is None:
-            print('Unable to find channel {}.  Found:'.format(cid))
-            for s in bot.servers:
-                for c in s.channels:
-                    print (' {} - {}'.format(c.name, c.id))
+    if lines:
+        payloads.append('\n'.join(lines))
+
+    return [pretty_print(p) for p in payloads]
+
+def print_missing_channel(bot, channel_id):
+    """Prints the channels the bot can see when a configured one can't be found"""
+    print('Unable to find channel {}.  Found:'.format(channel_id))
+    for s in bot.servers:
+        for c in s.channels:
+            print (' {} - {}'.format(c.name, c.id))
+
+def get_channels(bot, get_channel = None):
+    """
+    Gets the configured bot output channels that could be found.
+    A cached channel lookup can be passed in place of bot.get_channel,
+    in which case it is responsible for reporting missing channels.
+    """
+    channels = []
+    for cid in _config.channel_ids:
+        if get_channel is None:
+            channel = bot.get_channel(cid)
+            if channel is None:
+                print_missing_channel(bot, cid)
         else:
-            await bot.send_message(channel, pretty_print(message))
+            channel = get_channel(cid)
+
+        if channel is not None:
+            channels.append(channel)
+    return channels
 
 async def private(bot, user, message):
     """Sends the message to the given user"""
-    await bot.send_message(user, pretty_print(message))
+    for p in pack([message]):
+        await bot.send_message(user, p)
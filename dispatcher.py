@@ -0,0 +1,197 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from collections import deque
+import discord
+import json
+import time
+
+import discord_output
+
+# recipient key used for messages to the public output channels
+PUBLIC = None
+
+class MessageDispatcher():
+    """
+    Sends game loop messages to Discord from dedicated worker tasks so the
+    game tick only has to enqueue them.
+    Messages are held for a coalescing window per recipient so that everything
+    sent to a player or the public channels within it goes out in as few
+    Discord messages as possible.
+    Each recipient is always served by the same worker, which keeps
+    a player's messages in order while different players are sent to concurrently.
+    """
+
+    def __init__(self, bot, resolver, workers = 4, queue_size = 1000, max_retries = 5,
+            public_window = 0, private_window = 0):
+        self._bot = bot
+        self._resolver = resolver
+        self._queues = [asyncio.Queue(maxsize = queue_size) for _ in range(max(1, workers))]
+        self._max_retries = max_retries
+        self._tasks = []
+
+        # coalescing buffers
+        self._public_window = public_window
+        self._private_window = private_window
+        self._pending = {} # recipient: list(messages)
+        self._public_flushes = deque() # (flush time, recipient)
+        self._private_flushes = deque()
+
+        # metrics
+        self._enqueued = 0
+        self._coalesced = 0
+        self._sent = 0
+        self._dropped = 0
+        self._failed = 0
+        self._retries = 0
+        self._rate_limited = 0
+        self._max_depth = 0
+        self._max_latency = 0.0
+
+    def start(self):
+        self._tasks = [self._bot.loop.create_task(self.__worker(q)) for q in self._queues]
+
+    def stop(self):
+        """Stops the send workers right away. Anything still queued is dropped."""
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+
+    async def close(self, timeout):
+        """
+        Hands every buffered message to the send workers and waits up to timeout
+        seconds for them to be sent before stopping the workers.
+        """
+        self.flush(force = True)
+        if self._tasks and timeout > 0:
+            try:
+                await asyncio.wait_for(asyncio.gather(*[q.join() for q in self._queues]), timeout)
+            except asyncio.TimeoutError:
+                print('Gave up on {} unsent messages.'.format(self.get_depth()))
+        self.stop()
+
+    def send_public(self, message):
+        """Queues a message for the public output channels."""
+        self.__buffer(PUBLIC, message, self._public_window, self._public_flushes)
+
+    def send_private(self, user_id, message):
+        """Queues a message for the given user."""
+        self.__buffer(user_id, message, self._private_window, self._private_flushes)
+
+    def flush(self, force = False):
+        """
+        Hands every buffer whose coalescing window has elapsed to the send workers.
+        Meant to be called once per game tick.
+        """
+        now = time.monotonic()
+        for flushes in (self._public_flushes, self._private_flushes):
+            # windows are constant per queue, so flush times are in order
+            while flushes and (force or flushes[0][0] <= now):
+                _, recipient = flushes.popleft()
+                messages = self._pending.pop(recipient)
+                self.__enqueue(recipient, '\n'.join(messages))
+
+    def get_depth(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def get_report(self):
+        lines = []
+        lines.append('Workers:          {}'.format(len(self._queues)))
+        lines.append('Queued:           {} (max {}, capacity {})'.format(
+            self.get_depth(), self._max_depth, sum(q.maxsize for q in self._queues)))
+        lines.append('Buffered:         {} recipient(s)'.format(len(self._pending)))
+        lines.append('Enqueued:         {} ({} messages coalesced)'.format(self._enqueued, self._coalesced))
+        lines.append('Sent:             {} payloads'.format(self._sent))
+        lines.append('Dropped (full):   {}'.format(self._dropped))
+        lines.append('Failed:           {}'.format(self._failed))
+        lines.append('Retries:          {} ({} rate limited)'.format(self._retries, self._rate_limited))
+        lines.append('Max latency:      {:.1f} s'.format(self._max_latency))
+        lines.append(self._resolver.get_report())
+        return '\n'.join(lines)
+
+    def __buffer(self, recipient, message, window, flushes):
+        messages = self._pending.get(recipient)
+        if messages is None:
+            self._pending[recipient] = [message]
+            flushes.append((time.monotonic() + window, recipient))
+        else:
+            messages.append(message)
+            self._coalesced += 1
+
+    def __enqueue(self, recipient, message):
+        queue = self._queues[hash(recipient) % len(self._queues)]
+        try:
+            queue.put_nowait((recipient, message, time.monotonic()))
+        except asyncio.QueueFull:
+            self._dropped += 1
+            return
+
+        self._enqueued += 1
+        self._max_depth = max(self._max_depth, self.get_depth())
+
+    async def __worker(self, queue):
+        await self._bot.wait_until_ready()
+        while True:
+            recipient, message, queued_at = await queue.get()
+            try:
+                if recipient is PUBLIC:
+                    destinations = discord_output.get_channels(self._bot, self._resolver.get_channel)
+                else:
+                    user = await self._resolver.get_user(recipient)
+                    destinations = [] if user is None else [user]
+
+                for payload in discord_output.pack([message]):
+                    for d in destinations:
+                        await self.__send_with_backoff(d, payload)
+                self._max_latency = max(self._max_latency, time.monotonic() - queued_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed += 1
+                print('Unable to send message to {}: {}'.format(
+                    'public channels' if recipient is PUBLIC else recipient, e))
+            finally:
+                queue.task_done()
+
+    async def __send_with_backoff(self, destination, payload):
+        delay = 1.0
+        for attempt in range(self._max_retries + 1):
+            try:
+                await self._bot.send_message(destination, payload)
+                self._sent += 1
+                return
+            except discord.Forbidden:
+                # the user doesn't accept messages from us; retrying won't help
+                raise
+            except discord.HTTPException as e:
+                if attempt == self._max_retries:
+                    raise
+                self._retries += 1
+                wait = delay
+                if getattr(e.response, 'status', None) == 429:
+                    self._rate_limited += 1
+                    wait = max(wait, self.__get_retry_after(e))
+                await asyncio.sleep(wait)
+                delay *= 2
+
+    def __get_retry_after(self, error):
+        """Reads the retry delay Discord sends with rate limit responses."""
+        try:
+            return json.loads(error.text)['retry_after'] / 1000.0
+        except (ValueError, KeyError, TypeError):
+            return 0.0
@@ -0,0 +1,68 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import namedtuple
+
+class MissionCompleted(namedtuple('MissionCompleted', ['character', 'mission', 'xp'])):
+    """A character finished a mission and was awarded xp for it."""
+    __slots__ = ()
+
+class LevelUp(namedtuple('LevelUp', ['character', 'levels'])):
+    """A character gained one or more levels at once."""
+    __slots__ = ()
+
+class ShipPurchased(namedtuple('ShipPurchased', ['character', 'ship'])):
+    """A character bought a ship."""
+    __slots__ = ()
+
+class CharacterCreated(namedtuple('CharacterCreated', ['character'])):
+    """A player created a character."""
+    __slots__ = ()
+
+class EventBus():
+    """
+    Collects game events as they happen and delivers them in batches.
+    Subscribers get a list of every event of their type since the last
+    dispatch, so they can handle a whole tick's worth at once.
+    """
+
+    def __init__(self):
+        self._subscribers = {} # event type: list(handler)
+        self._pending = []
+
+    def subscribe(self, event_type, handler):
+        """Connects a handler that is called with a list of events of the given type."""
+        self._subscribers.setdefault(event_type, []).append(handler)
+
+    def publish(self, event):
+        """Queues an event for the next dispatch."""
+        self._pending.append(event)
+
+    def dispatch(self):
+        """
+        Delivers the queued events, grouped by type in the order each type was
+        first published. Events published by handlers are delivered before this returns.
+        """
+        while self._pending:
+            batches = {}
+            for event in self._pending:
+                batches.setdefault(type(event), []).append(event)
+            self._pending = []
+
+            for event_type, batch in batches.items():
+                for handler in self._subscribers.get(event_type, ()):
+                    handler(batch)
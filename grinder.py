@@ -17,30 +17,45 @@ along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
 
 # external modules
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import discord
 from discord.ext import commands
 import random
+import time
 
 # Grinder modules
-from character import Character
+import array_store
+import catch_up
+from character import Character, CharacterRow
 import config
+from content_reload import ContentReloader
+import content_sync
 import database
+from dispatcher import MessageDispatcher
 from hangar import Hangar
+from leaderboard import Leaderboard
 from main import is_admin
 import discord_output
-import json_util
-import mission
+from events import EventBus, MissionCompleted, LevelUp, ShipPurchased, CharacterCreated
+import mapper
 from mission_control import MissionControl
+from persistence import PersistenceWorker
+from render_cache import RenderCache
+from resolution_cache import DiscordResolver
+from roster import Roster
+from scheduler import MissionScheduler
+from tick_clock import TickClock
 import weapon
+import world_snapshot
 
 # it would be nice for Grinder to own its own instance of this,
 # but it seems that this must be static since command checks can't use instance methods
-_characters = {}
+_roster = None
 
 # command check that enforces character existence
 def has_character(ctx):
-    return ctx.message.author.id in _characters.keys()
+    return ctx.message.author.id in _roster
 
 class Grinder():
     """
@@ -51,7 +66,6 @@ class Grinder():
 
     def __init__(self, bot):
         self._bot = bot
-        _characters = {}
         self._game_uptime = 0
         self._config = config.get()
 
@@ -59,41 +73,223 @@ class Grinder():
         self._public_messages = []
         self._private_messages = {} # user: list(messages)
 
-        ships = json_util.read_object_from_file('ships.json')
-        self._hangar = Hangar()
-        self._hangar.update_db_ship_blueprints(ships)
+        self._persistence = PersistenceWorker(database.Session)
+        self._persistence.start()
+        self._creating = set() # players whose new characters are being stored
 
-        weapons = json_util.read_object_from_file('weapons.json')
-        database.update_db_weapon_blueprints(weapons)
+        self._hangar = Hangar(self._persistence)
+        self._hangar.update_db_ship_blueprints('ships.json')
+
+        print(content_sync.sync_weapon_blueprints('weapons.json'))
+        print('Weapons loaded.')
 
         random.seed()
 
         # pick up mission updates
-        self._mission_control = MissionControl()
+        self._mission_control = MissionControl(self._config.mission_paths, int(self._config.mission_sync_batch))
         self._mission_control.update_db_missions()
         print('Missions loaded.')
 
+        self._render_cache = RenderCache()
+        self._render_cache.prerender_blueprints(self._hangar.get_ship_blueprints())
+        self._render_cache.prerender_missions(self._mission_control.get_mission_graph())
+
+        for name, step in database.check_query_plans():
+            print('Warning: {} lookup is not indexed ({})'.format(name, step))
+
+        self._use_array_store = False
+        if self._config.use_array_store:
+            if array_store.available():
+                self._use_array_store = True
+            else:
+                print('use_array_store is set but numpy is not installed, ticking characters as objects.')
+        self._scheduler = array_store.CharacterArrayStore() if self._use_array_store else MissionScheduler()
+        self._tick_clock = TickClock(
+            overrun_policy = self._config.tick_overrun_policy,
+            max_catch_up = int(self._config.tick_max_catch_up))
+
+        self._leaderboard = Leaderboard()
+        global _roster
+        _roster = self._roster = Roster(self._hangar, capacity = int(self._config.resident_characters))
+
+        # delivered once per game tick
+        self._events = EventBus()
+        self._events.subscribe(MissionCompleted, self.__missions_completed)
+        self._events.subscribe(MissionCompleted, self.__update_leaderboard)
+        self._events.subscribe(LevelUp, self.__announce_levels)
+        self._events.subscribe(CharacterCreated, self.__announce_characters)
+        self._events.subscribe(ShipPurchased, self.__announce_ships)
+
+        self._snapshot_writer = ThreadPoolExecutor(max_workers = 1) # keeps snapshot writes in order
         self.__init_characters()
 
+        self._content_reloader = ContentReloader(self._bot.loop, self._hangar, self._mission_control,
+            self._render_cache, self.__get_characters, chunk_size = int(self._config.content_reload_chunk))
+        self._content_watch_task = None
+        if float(self._config.content_watch_interval) > 0:
+            self._content_watch_task = self._bot.loop.create_task(
+                self._content_reloader.watch(float(self._config.content_watch_interval)))
+
+        self._resolver = DiscordResolver(self._bot,
+            max_size = int(self._config.resolve_cache_size),
+            ttl = float(self._config.resolve_cache_ttl),
+            negative_ttl = float(self._config.resolve_negative_ttl))
+        self._dispatcher = MessageDispatcher(self._bot, self._resolver,
+            workers = int(self._config.dispatch_workers),
+            queue_size = int(self._config.dispatch_queue_size),
+            max_retries = int(self._config.dispatch_max_retries),
+            public_window = float(self._config.coalesce_public_window),
+            private_window = float(self._config.coalesce_private_window))
+        self._dispatcher.start()
+        self._closing = None
+
         self._game_task = self._bot.loop.create_task(self.__game_loop())
 
     def __unload(self):
         """Called when this cog is unloaded on shutdown."""
         print('Shutting down Grinder.')
         self._game_task.cancel()
-        self.__save_game_to_db()
+        if self._content_watch_task is not None:
+            self._content_watch_task.cancel()
+        self._events.dispatch()
+        self.__dispatch_message_queues()
+        closing = self._dispatcher.close(float(self._config.dispatch_close_timeout))
+        if self._bot.loop.is_running():
+            # unloaded by a command, the workers keep sending while the loop runs
+            self._closing = self._bot.loop.create_task(closing)
+        else:
+            self._bot.loop.run_until_complete(closing)
+        futures = self.__save_game_to_db()
+        self._persistence.stop()
+        for f in futures:
+            if f.done() and f.exception() is not None:
+                print('Changes were lost on shutdown: {}'.format(f.exception()))
+        if self._config.snapshot_file:
+            self.__write_snapshot().result()
+        self._snapshot_writer.shutdown()
+
+    async def wait_closed(self):
+        """Waits for the messages queued when the cog was unloaded to be sent."""
+        if self._closing is not None:
+            await self._closing
+
+    def __get_characters(self):
+        return self._roster.values()
 
     def __init_characters(self):
-        characters = database.session.query(Character).all()
+        """
+        Loads every character, from the world snapshot if there's a usable one.
+        After a crash the snapshot can be older than the DB, so it's only used
+        if the DB hasn't been written since it was taken.
+        """
+        now = int(time.time())
+        characters = None
+        if self._config.snapshot_file:
+            start = time.perf_counter()
+            snapshot = world_snapshot.read(self._config.snapshot_file)
+            if snapshot is not None and snapshot.sequence != self._persistence.get_sequence():
+                print('World snapshot is older than the DB, loading characters from the DB.')
+                snapshot = None
+            if snapshot is not None:
+                characters, skipped = world_snapshot.restore(snapshot, self._hangar.get_ship_blueprints())
+                characters += self.__query_characters(skipped)
+                print('Restored {} characters from the world snapshot in {:.1f} ms.'.format(
+                    len(characters), (time.perf_counter() - start) * 1000))
+                self.__check_snapshot(snapshot)
+
+        if characters is None:
+            characters = self.__query_characters()
+
+        self.__load_characters(characters, now)
+
+    def __check_snapshot(self, snapshot):
+        """
+        Compares the snapshot with the DB row by row on the snapshot thread, which
+        only finds rows that were changed outside the game since it was taken.
+        """
+        def done(f):
+            if f.cancelled():
+                return
+            if f.exception() is not None:
+                print('Unable to check the world snapshot against the DB: {}'.format(f.exception()))
+                return
+            stale, missing = f.result()
+            if stale or missing:
+                print('Warning: {} characters were changed in the DB since the world snapshot was taken, '
+                    'the snapshot\'s copies were kept.'.format(len(stale) + len(missing)))
+
+        future = self._snapshot_writer.submit(world_snapshot.find_stale, snapshot)
+        asyncio.wrap_future(future, loop = self._bot.loop).add_done_callback(done)
+
+    def __query_characters(self, ids = None):
+        """Loads characters from the DB, all of them or only those with the given ids."""
+        if ids is None:
+            return mapper.query(database.session, Character)
+
+        characters = []
+        for i in range(0, len(ids), 500):
+            characters += mapper.query(database.session, Character, CharacterRow.id.in_(ids[i:i + 500]))
+        return characters
+
+    def __load_characters(self, characters, now):
+        mission_graph = self._mission_control.get_mission_graph()
         for c in characters:
-            database.session.expunge(c) # detach object from db
+            c.resolve_mission(mission_graph)
+
+        # complete everything that would have finished while we were offline
+        summaries = catch_up.fast_forward_all(characters, self._mission_control, now)
+        for c, summary in zip(characters, summaries):
+            if summary.get_mission_count() > 0:
+                self.__queue_private_message(c._owner_id, summary.get_private_message())
+                announcement = summary.get_public_message()
+                if announcement is not None:
+                    self._public_messages.append(announcement)
+
             self.__init_character(c)
             print('Loaded {}'.format(c))
 
+    def __remove_character(self, c):
+        """Stops tracking a character and drops its unsaved changes."""
+        self._scheduler.unschedule(c)
+        self._leaderboard.remove(c)
+        self._hangar.forget_owner(c)
+        mapper.discard_changes(c)
+        self._roster.remove(c._owner_id)
+
+    def __write_snapshot(self):
+        """Encodes the world now and writes it on the snapshot thread. Returns the write's Future."""
+        data = world_snapshot.encode(self._roster.values(), self._persistence.get_sequence())
+        return self._snapshot_writer.submit(world_snapshot.write, self._config.snapshot_file, data)
+
     def __init_character(self, character):
-        character.connect_level_up(self.__announce_character_level)
-        character.connect_mission_complete(self.__mission_complete)
-        _characters[character._owner_id] = character
+        self._roster.add(character)
+        self._leaderboard.update(character)
+
+        if character.get_current_mission() is None:
+            self.__start_next_mission(character)
+        else:
+            self._scheduler.schedule(character)
+
+    # gateway events that make cached users and channels stale
+    async def on_ready(self):
+        self._resolver.clear()
+
+    async def on_member_update(self, before, after):
+        self._resolver.invalidate_user(after.id)
+
+    async def on_channel_create(self, channel):
+        # clears a cached miss for a configured channel
+        self._resolver.invalidate_channel(channel.id)
+
+    async def on_channel_update(self, before, after):
+        self._resolver.invalidate_channel(after.id)
+
+    async def on_channel_delete(self, channel):
+        self._resolver.invalidate_channel(channel.id)
+
+    async def on_server_remove(self, server):
+        for c in server.channels:
+            self._resolver.invalidate_channel(c.id)
 
     @commands.command(pass_context = True)
     async def create_character(self, ctx, *args):
@@ -101,8 +297,10 @@ class Grinder():
         player = ctx.message.author.id
         msg = ''
 
-        if player in _characters:
-            msg = 'You already have a character named {}.'.format(_characters[player]._name)
+        if player in self._roster:
+            msg = 'You already have a character named {}.'.format(self._roster.peek(player)._name)
+        elif player in self._creating:
+            msg = 'Your character is still being created.'
         elif len(args) == 0:
             msg = 'You must name your character.'
         elif len(args[0]) > 30:
@@ -111,13 +309,15 @@ class Grinder():
             name = args[0]
             # create the new char and store in the db
             c = Character(name, player)
-            database.session.add(c)
-            database.session.commit()
-            database.session.expunge(c)
+            self._creating.add(player)
+            try:
+                c.id = await asyncio.wrap_future(self._persistence.insert(CharacterRow, c.get_values()))
+            finally:
+                self._creating.discard(player)
 
             self.__init_character(c)
             msg = 'Created character {}!'.format(name)
-            self._public_messages.append('{} has entered the world!'.format(name))
+            self._events.publish(CharacterCreated(c))
 
         await discord_output.private(self._bot, ctx.message.author, msg)
 
@@ -126,12 +326,11 @@ class Grinder():
         """Delete's a player's character"""
         player = ctx.message.author.id
         msg = ''
-        if player in _characters:
-            c = _characters[player]
-            database.session.delete(c)
-            database.session.commit()
+        if player in self._roster:
+            c = self._roster.peek(player)
+            self.__remove_character(c)
             name = c._name
-            del _characters[player]
+            await asyncio.wrap_future(self._persistence.delete(CharacterRow, c.id))
             msg = '{} has been deleted.'.format(name)
             self._public_messages.append('{} stumbled out an airlock and died.'.format(name))
         else:
@@ -144,9 +343,9 @@ class Grinder():
         """Gets your current character sheet."""
         player = ctx.message.author.id
         msg = ''
-        if player in _characters:
-            c = _characters[player]
-            msg = c.get_info_card()
+        if player in self._roster:
+            c = self._roster.get(player)
+            msg = self._render_cache.get_character_card(c, self._scheduler.get_progress_ticks(c))
         else:
             msg = 'Create a character first.'
 
@@ -166,6 +365,48 @@ class Grinder():
 
         await discord_output.private(self._bot, ctx.message.author, msg)
 
+    @commands.command(pass_context = True)
+    @commands.check(is_admin)
+    async def tick_stats(self, ctx):
+        """[ADMIN] Gets game loop timings and how close they are to the tick budget."""
+        await discord_output.private(self._bot, ctx.message.author, self._tick_clock.get_report())
+
+    @commands.command(pass_context = True)
+    @commands.check(is_admin)
+    async def db_stats(self, ctx):
+        """[ADMIN] Gets write-behind persistence statistics."""
+        await discord_output.private(self._bot, ctx.message.author, self._persistence.get_report())
+
+    @commands.command(pass_context = True)
+    @commands.check(is_admin)
+    async def dispatch_stats(self, ctx):
+        """[ADMIN] Gets outbound message queue and send statistics."""
+        await discord_output.private(self._bot, ctx.message.author, self._dispatcher.get_report())
+
+    @commands.command(pass_context = True)
+    @commands.check(is_admin)
+    async def reload_content(self, ctx, *args):
+        """[ADMIN] Applies changes to the ship, weapon and mission files. Use 'force' to resync everything."""
+        force = len(args) > 0 and args[0] == 'force'
+        try:
+            msg = await self._content_reloader.reload(force)
+        except (OSError, ValueError) as e:
+            msg = 'Content reload failed: {}'.format(e)
+
+        await discord_output.private(self._bot, ctx.message.author, msg)
+
+    @commands.command(pass_context = True)
+    @commands.check(is_admin)
+    async def render_stats(self, ctx):
+        """[ADMIN] Gets info card render cache hit rates."""
+        await discord_output.private(self._bot, ctx.message.author, self._render_cache.get_report())
+
+    @commands.command(pass_context = True)
+    @commands.check(is_admin)
+    async def roster_stats(self, ctx):
+        """[ADMIN] Gets how many characters are resident in memory and how often they're paged."""
+        await discord_output.private(self._bot, ctx.message.author, self._roster.get_report())
+
     @commands.command(pass_context = True)
     async def uptime(self, ctx):
         """Gets Grinder's uptime."""
@@ -187,9 +428,18 @@ class Grinder():
          !ship sell (ship name)
         """
 
-        msg = 'Sorry, command not understood... try !help ship'
         owner_id = ctx.message.author.id
-        character = _characters[owner_id]
+        # some subcommands await DB writes, and the character mustn't go dormant meanwhile
+        character = self._roster.pin(owner_id)
+        try:
+            msg = await self.__ship_command(character, args)
+        finally:
+            self._roster.unpin(owner_id)
+
+        await discord_output.private(self._bot, ctx.message.author, msg)
+
+    async def __ship_command(self, character, args):
+        msg = 'Sorry, command not understood... try !help ship'
         current_ship = character.get_current_ship()
 
         if len(args) == 0:
@@ -197,7 +447,8 @@ class Grinder():
             if current_ship is not None:
                 name = current_ship.get_name()
                 msg = 'You are aboard {}.\n\n{}'.format(
-                    name if name is not None else 'an unnamed ship (you can name it with !ship name [name])', current_ship.get_info_card())
+                    name if name is not None else 'an unnamed ship (you can name it with !ship name [name])',
+                    self._render_cache.get_ship_card(current_ship))
         else:
             if args[0] == 'list':
                 ships = self._hangar.get_owned_ships(character)
@@ -205,42 +456,39 @@ class Grinder():
                     msg = 'You don\'t own any ships.'
                 else:
                     msg = 'Your ships:\n\n'
-                    msg += '\n\n'.join(s.get_info_card() for s in ships)
+                    msg += '\n\n'.join(self._render_cache.get_ship_card(s) for s in ships)
             elif args[0] == 'name':
                 msg = 'You must board a ship before naming it.'
                 if len(args) >= 2 and current_ship is not None:
-                    current_ship.set_name(args[1])
-                    msg = 'You have christened this ship \'{}\'.'.format(args[1])
-                    current_ship.save(database.session)
-                    database.session.commit()
+                    if await self._hangar.rename_ship(character, current_ship, args[1]):
+                        msg = 'You have christened this ship \'{}\'.'.format(args[1])
+                    else:
+                        msg = 'You already own a ship named \'{}\'.'.format(args[1])
             elif args[0] == 'board':
                 msg = 'Specify a ship\'s name to board.'
                 if len(args) >= 2:
-                    ships = self._hangar.get_owned_ships(character)
-                    for s in ships:
-                        if s.get_name().lower() == args[1].lower():
-                            character.set_current_ship(s)
-                            msg = 'You boarded {}.'.format(s.get_name())
-                            break
+                    s = self._hangar.find_ship(character, args[1])
+                    if s is not None:
+                        character.set_current_ship(s)
+                        msg = 'You boarded {}.'.format(s.get_name())
             elif args[0] == 'buy':
                 ships = self._hangar.get_ship_blueprints()
                 if len(args) == 1:
                     # just return the list of ships
                     msg = 'Ships available to buy at this hangar:\n\n'
-                    msg += '\n\n'.join(s.get_info_card() for s in ships)
+                    msg += '\n\n'.join(self._render_cache.get_blueprint_card(s) for s in ships)
                 else:
                     subcmd = args[1].lower()
                     blueprint = [s for s in ships if s.get_model().lower() == subcmd]
                     if len(blueprint) == 1:
                         bp = blueprint[0]
                         if character.can_afford(bp.get_cost()):
-                            new_ship = self._hangar.purchase_ship(character, bp)
+                            new_ship = await self._hangar.purchase_ship(character, bp)
                             if new_ship is not None:
                                 # auto-board for now
                                 character.set_current_ship(new_ship)
                                 msg = 'You successfully bought and boarded a {}!'.format(new_ship.get_model())
-                                self._public_messages.append('{} just purchased a ship!  (Model: {})'.format(
-                                    character.get_name(), new_ship.get_model()))
+                                self._events.publish(ShipPurchased(character, new_ship))
                         else:
                             msg = 'Sorry, you need {} more credits to purchase the {}.'.format(
                                 bp.get_cost() - character.get_credits(),
@@ -249,94 +497,180 @@ class Grinder():
             elif args[0] == 'sell':
                 msg = 'Specify a ship\'s name to sell.'
                 if len(args) >= 2:
-                    ships = self._hangar.get_owned_ships(character)
-                    for s in ships:
-                        if s.get_name().lower() == args[1].lower():
-                            if current_ship is not None and s.id == current_ship.id:
+                    s = self._hangar.find_ship(character, args[1])
+                    if s is not None:
+                        msg = 'You are already selling {}.'.format(s.get_name())
+                        if await self._hangar.sell_ship(character, s):
+                            if character.get_current_ship() is s:
                                 character.set_current_ship(None)
-                            self._hangar.sell_ship(character, s)
                             msg = 'You sold {}!'.format(s.get_name())
                             self._public_messages.append('{} sold their ship \'{}\'!  (Model: {})'.format(
                                 character.get_name(), s.get_name(), s.get_model()))
 
-        await discord_output.private(self._bot, ctx.message.author, msg)
+        return msg
 
 
     @commands.command(pass_context = True)
-    async def scoreboard(self, ctx):
-        """Prints a scoreboard of all characters."""
+    async def scoreboard(self, ctx, *args):
+        """
+        Prints a page of the scoreboard.
+        usage:
+         !scoreboard [page]
+        """
+        page_size = int(self._config.scoreboard_page_size)
+        page_count = self._leaderboard.get_page_count(page_size)
+        page = 1
+        if len(args) > 0:
+            try:
+                page = min(max(1, int(args[0])), page_count)
+            except ValueError:
+                pass
+
+        characters = [self._roster.peek(o) for o in self._leaderboard.get_page(page - 1, page_size)]
+        first_rank = (page - 1) * page_size + 1
+
+        rankstr = '#'
         namestr = 'Name'
         xpstr = 'XP'
         levelstr = 'Level'
 
-        namelen = len(namestr)
-        xplen = len(xpstr)
-        levellen = len(levelstr)
-
-        for c in _characters.values():
-            if len(c._name) > namelen:
-                namelen = len(c._name)
-            if len(str(c.get_xp())) > xplen:
-                xplen = len(str(c.get_xp()))
-            if (len(str(c.get_level())) > levellen):
-                levellen = len(str(c.get_level()))
-
-        levellen += 1
-        namelen += 2
-        xplen += 1
+        ranklen = max(len(rankstr), len(str(first_rank + len(characters) - 1)))
+        namelen = max([len(namestr)] + [len(c._name) for c in characters]) + 2
+        xplen = max([len(xpstr)] + [len(str(c.get_xp())) for c in characters]) + 1
+        levellen = max([len(levelstr)] + [len(str(c.get_level())) for c in characters]) + 1
 
-        layout = "{0:>{l}} | {1:^{n}} | {2:<{x}}\n"
-        msg = layout.format(levelstr, namestr, xpstr, l = levellen, n = namelen, x = xplen)
-        msg += '-' * (levellen + namelen + xplen + 6)
-        msg += '\n'
+        layout = "{0:>{r}} | {1:>{l}} | {2:^{n}} | {3:<{x}}"
+        lines = [layout.format(rankstr, levelstr, namestr, xpstr, r = ranklen, l = levellen, n = namelen, x = xplen)]
+        lines.append('-' * (ranklen + levellen + namelen + xplen + 9))
+        for rank, c in enumerate(characters, first_rank):
+            lines.append(layout.format(rank, c.get_level(), c._name, c.get_xp(), r = ranklen, l = levellen, n = namelen, x = xplen))
+        lines.append('Page {} of {}'.format(page, page_count))
 
-        for c in sorted(_characters.values(), key = lambda char: char.get_xp(), reverse = True):
-            msg += layout.format(c.get_level(), c._name, c.get_xp(), l = levellen, n = namelen, x = xplen)
+        await discord_output.private(self._bot, ctx.message.author, '\n'.join(lines))
 
+    @commands.command(pass_context = True)
+    @commands.check(has_character)
+    async def rank(self, ctx):
+        """Gets your character's place on the scoreboard."""
+        # only reads what dormant characters keep
+        c = self._roster.peek(ctx.message.author.id)
+        msg = '{} is ranked {} of {} with {} XP (level {}).'.format(
+            c.get_name(), self._leaderboard.get_rank(c), len(self._leaderboard), c.get_xp(), c.get_level())
         await discord_output.private(self._bot, ctx.message.author, msg)
 
-    def __announce_character_level(self, character):
-        """Callback bound to characters that queues a level-up announcement."""
-        msg = '{} is now level {} ({} XP)!'.format(character._name, character.get_level(), character.get_xp())
-        self._public_messages.append(msg)
-
-    def __mission_complete(self, character):
-        """Callback bound to character mission complete signals"""
-        current_mission = character.get_current_mission()
-        xp_gain = current_mission.get_variable_xp_reward()
-        character.add_xp(xp_gain)
-        self.__queue_private_message(character._owner_id, current_mission._epilogue)
-        self.__queue_private_message(character._owner_id, 'You completed {} and were awarded {} XP!'.format(current_mission._name, xp_gain))
-        self.__start_next_mission(character)
+    def __announce_levels(self, events):
+        """Queues an announcement for every LevelUp."""
+        for e in events:
+            c = e.character
+            self._public_messages.append('{} is now level {} ({} XP)!'.format(c._name, c.get_level(), c.get_xp()))
+
+    def __announce_characters(self, events):
+        for e in events:
+            self._public_messages.append('{} has entered the world!'.format(e.character.get_name()))
+
+    def __announce_ships(self, events):
+        for e in events:
+            self._public_messages.append('{} just purchased a ship!  (Model: {})'.format(
+                e.character.get_name(), e.ship.get_model()))
+
+    def __missions_completed(self, events):
+        """Tells players about their finished missions and starts their next ones."""
+        new_missions = self._mission_control.generate_missions_for([e.character for e in events])
+        for e, new_mission in zip(events, new_missions):
+            owner_id = e.character._owner_id
+            self.__queue_private_message(owner_id, e.mission.epilogue)
+            self.__queue_private_message(owner_id, 'You completed {} and were awarded {} XP!'.format(e.mission.get_name(), e.xp))
+            self.__start_mission(e.character, new_mission)
+
+    def __update_leaderboard(self, events):
+        for e in events:
+            self._leaderboard.update(e.character)
 
     def __start_next_mission(self, character):
-        new_mission = self._mission_control.generate_mission_for(character)
+        self.__start_mission(character, self._mission_control.generate_mission_for(character))
 
+    def __start_mission(self, character, new_mission):
         prev_mission = character.get_current_mission()
         aux_msg = ''
         if prev_mission is not None and prev_mission.id == new_mission.id:
             aux_msg = 'Deja vu...\n'
-        character.set_new_mission(new_mission)
-        self.__queue_private_message(character._owner_id, 'You have started a new mission.\n{}\n{}'.format(aux_msg, new_mission.get_info_card()))
+        character.set_new_mission(new_mission, int(time.time()))
+        self._scheduler.schedule(character)
+        self.__queue_private_message(character._owner_id, 'You have started a new mission.\n{}\n{}'.format(aux_msg, self._render_cache.get_mission_card(new_mission)))
+
+    def __advance_missions(self):
+        """Advances every mission one tick and completes the ones that are due."""
+        due = self._scheduler.advance()
+        if not due:
+            return
+
+        characters = [self._roster.borrow(o) for o in due]
+        if self._use_array_store:
+            rewards = self._scheduler.award_xp(due)
+        else:
+            rewards = [c.get_current_mission().get_variable_xp_reward() for c in characters]
 
-    async def __print_message_queues(self):
-        """Prints all pending game loop messages."""
+        level_ups = Character.add_xp_batch(characters, rewards)
+        for c, xp in zip(characters, rewards):
+            self._events.publish(MissionCompleted(c, c.get_current_mission(), xp))
+        for c, levels in level_ups:
+            self._events.publish(LevelUp(c, levels))
+
+    def __end_tick(self):
+        """Delivers the tick's events and puts the characters it woke up back to sleep."""
+        self._events.dispatch()
+        self._roster.release()
+
+    def __dispatch_message_queues(self):
+        """Hands all pending game loop messages to the dispatcher."""
         if self._public_messages:
             concat = '\n'.join(self._public_messages)
             self._public_messages = []
-            await discord_output.public(self._bot, concat)
+            self._dispatcher.send_public(concat)
 
         if self._private_messages:
             for user_id in self._private_messages:
                 concat = '\n'.join(self._private_messages[user_id])
-                user = await self._bot.get_user_info(user_id)
-                await discord_output.private(self._bot, user, concat)
+                self._dispatcher.send_private(user_id, concat)
             self._private_messages = {}
 
+        self._dispatcher.flush()
+
     def __save_game_to_db(self):
-        for c in _characters.values():
-            c.save(database.session)
-        database.session.commit()
+        """
+        Hands every unsaved change to the persistence worker. Changes that can't be
+        written are marked unsaved again, so the next save retries them.
+        Returns the writes' Futures.
+        """
+        futures = []
+        # ships kept since the last save have been written by now
+        self._hangar.trim()
+        # queued first, since a character may have changed again after going dormant
+        evicted = self._roster.take_changes()
+        if evicted:
+            futures.append(self.__watch_save(self._persistence.update(evicted), evicted, {}))
+        objects = {}
+        changes = mapper.collect_changes(objects)
+        if changes:
+            futures.append(self.__watch_save(self._persistence.update(changes), changes, objects))
+        return futures
+
+    def __watch_save(self, future, changes, objects):
+        def done(f):
+            if f.cancelled():
+                return
+            e = f.exception()
+            if e is None:
+                return
+            failed = dict(getattr(e, 'failed', changes))
+            print('Unable to save {} rows, they will be saved again: {}'.format(
+                sum(len(rows) for rows in failed.values()), e))
+            # characters may have gone dormant since, so the roster knows where they are
+            self._roster.restore_changes({CharacterRow: failed.pop(CharacterRow, [])})
+            mapper.restore_changes(failed, objects)
+
+        asyncio.wrap_future(future, loop = self._bot.loop).add_done_callback(done)
+        return future
 
     def __queue_private_message(self, user, message):
         if user not in self._private_messages:
@@ -348,21 +682,37 @@ class Grinder():
         await self._bot.wait_until_ready()
         print('Game loop started.')
 
+        clock = self._tick_clock
+        clock.start()
         while True:
-            await self.__print_message_queues()
-            await asyncio.sleep(1)
+            ticks = await clock.wait()
 
             # synchronous logic only below
-            self._game_uptime += 1
-            for c in _characters.values():
-                if c.get_current_mission() is None:
-                    self.__start_next_mission(c)
-                else:
-                    c.run_current_mission()
-
-            if self._game_uptime % int(self._config.db_commit_wait) == 0:
-                print('saving game state')
-                self.__save_game_to_db()
+            save_due = False
+            snapshot_due = False
+            snapshot_wait = int(self._config.snapshot_wait) if self._config.snapshot_file else 0
+            with clock.phase('update'):
+                for _ in range(ticks):
+                    self._game_uptime += 1
+                    self.__advance_missions()
+                    self.__end_tick()
+                    if self._game_uptime % int(self._config.db_commit_wait) == 0:
+                        save_due = True
+                    if snapshot_wait > 0 and self._game_uptime % snapshot_wait == 0:
+                        snapshot_due = True
+
+            with clock.phase('persist'):
+                if save_due or snapshot_due:
+                    print('saving game state')
+                    self.__save_game_to_db()
+                if snapshot_due:
+                    # taken right after a save so that it matches what the DB is about to hold
+                    self.__write_snapshot()
+
+            with clock.phase('dispatch'):
+                self.__dispatch_message_queues()
+
+            clock.end_tick()
 
 def setup(bot):
     """Cog setup"""
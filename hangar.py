@@ -15,68 +15,196 @@ You should have received a copy of the GNU General Public License
 along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from character import Character
+import asyncio
+from cargo import Cargo
+import content_sync
 import database
-import datetime
-import json_util
-from ship import ShipBlueprint, Ship
-from sqlalchemy import orm
+import mapper
+import random
+from ship import ShipBlueprint, Ship, ShipRow
 
 class Hangar():
     """
-    Class that tracks and controls ship instance storage
+    Class that tracks and controls ship instance storage.
+    Each character's ships are loaded once and then kept in memory, indexed by
+    case-folded name, with every change written through to the DB.
     """
 
-    def __init__(self):
+    def __init__(self, persistence):
+        self._persistence = persistence
         self._ship_blueprints = database.session.query(ShipBlueprint).all()
+        self._owned_ships = {} # character id: {case-folded name: Ship}
+        self._unsaved_ships = {} # character id: index of a dormant character, kept until its ships are saved
+        self._selling = set() # ids of ships whose delete is being written
 
-    def update_db_ship_blueprints(self, blueprints):
+    def update_db_ship_blueprints(self, path):
         """
         Updates the DB with ship blueprints read from the ships json file
         """
-        for ship in blueprints:
-            try:
-                # update existing ships
-                db_blueprint = database.session.query(ShipBlueprint).filter(ShipBlueprint._model == ship.model).one()
-                db_blueprint.update_data(ship)
-            except orm.exc.NoResultFound:
-                # add new ship
-                db_ship = ShipBlueprint(ship)
-                database.session.add(db_ship)
-        database.session.commit()
-        self._ship_blueprints = database.session.query(ShipBlueprint).all()
+        print(content_sync.sync_ship_blueprints(path))
+        self.refresh_ship_blueprints()
         print('Ships loaded.')
 
+    def refresh_ship_blueprints(self):
+        """
+        Reloads the blueprints from the DB. Blueprints that are already loaded are
+        updated in place, so ships that refer to them see the changes too.
+        """
+        self._ship_blueprints[:] = database.session.query(ShipBlueprint).populate_existing().all()
+
     def get_ship_blueprints(self):
         return self._ship_blueprints
 
+    def __get_index(self, character):
+        """Gets the character's ships by case-folded name, loading them on first use."""
+        index = self._owned_ships.get(character.id)
+        if index is None:
+            index = self._unsaved_ships.pop(character.id, None)
+            if index is not None:
+                self._owned_ships[character.id] = index
+                return index
+
+            ships = mapper.query(database.read_session, Ship, ShipRow._owner_id == character.id, order_by = ShipRow.id)
+            cargo = {}
+            if ships:
+                for item in database.read_session.query(Cargo).filter(Cargo._cargo_hold_id.in_([s.id for s in ships])):
+                    cargo.setdefault(item._cargo_hold_id, []).append(item)
+            database.read_session.close() # detaches the cargo and releases the connection
+
+            blueprints = {b.id: b for b in self._ship_blueprints}
+            current_ship = character.get_current_ship()
+            index = {}
+            for s in ships:
+                # share the instances the rest of the game already holds
+                if current_ship is not None and s.id == current_ship.id:
+                    s = current_ship
+                else:
+                    s._blueprint = blueprints.get(s._blueprint_id)
+                    s._cargo = cargo.get(s.id, [])
+                index[self.__key(s)] = s
+            self._owned_ships[character.id] = index
+        return index
+
+    def __fold(self, name):
+        return name.casefold()
+
+    def __key(self, ship):
+        # ships saved before names were required are indexed by id
+        name = ship.get_name()
+        return ship.id if name is None else self.__fold(name)
+
     def get_owned_ships(self, character):
-        ships = database.session.query(Ship).filter(Ship._owner_id == character.id).all()
-        return ships
+        # a ship being renamed is indexed under both names until the rename is written
+        return list(dict.fromkeys(self.__get_index(character).values()))
+
+    def find_ship(self, character, name):
+        """Gets the character's ship with the given name, ignoring case, or None."""
+        return self.__get_index(character).get(self.__fold(name))
+
+    def get_ship(self, character, ship_id):
+        """Gets the character's ship with the given id, or None."""
+        for s in self.__get_index(character).values():
+            if s.id == ship_id:
+                return s
+        return None
+
+    async def rename_ship(self, character, ship, name):
+        """
+        Renames one of the character's ships, writing the new name through so names
+        are never swapped around inside a batched save.
+        Returns False if they already own a ship by that name.
+        """
+        index = self.__get_index(character)
+        key = self.__fold(name)
+        if index.get(key, ship) is not ship:
+            return False
+
+        # both names stay claimed until the write is done
+        old_key = self.__key(ship)
+        index[key] = ship
+        try:
+            await asyncio.wrap_future(self._persistence.update({ShipRow: [{'id': ship.id, '_name': name}]}))
+        except:
+            if key != old_key:
+                del index[key]
+            raise
+
+        if key != old_key:
+            index.pop(old_key, None)
+        ship.set_name(name)
+        return True
+
+    def forget_owner(self, character):
+        """Drops the character's ships from memory."""
+        self._owned_ships.pop(character.id, None)
+        self._unsaved_ships.pop(character.id, None)
+
+    def release_owner(self, character):
+        """
+        Drops the ships of a character that went dormant. Ships with unsaved changes
+        are kept until trim() finds them saved, so a reload never reads them stale.
+        """
+        index = self._owned_ships.pop(character.id, None)
+        if index is not None and any(mapper.is_dirty(s) for s in index.values()):
+            self._unsaved_ships[character.id] = index
 
-    def purchase_ship(self, character, blueprint):
+    def trim(self):
+        """Drops the kept ships of dormant characters once they have no unsaved changes."""
+        for owner, index in list(self._unsaved_ships.items()):
+            if not any(mapper.is_dirty(s) for s in index.values()):
+                del self._unsaved_ships[owner]
+
+    async def purchase_ship(self, character, blueprint):
         ship = None
 
         if blueprint in self._ship_blueprints:
+            index = self.__get_index(character)
             character.subtract_credits(blueprint.get_cost())
-            ship_name = self.__generate_ship_name(character)
+            ship_name = self.__generate_ship_name(character, index)
             ship = Ship(character.id, blueprint, ship_name)
-            database.session.add(ship)
-            database.session.commit()
+            # claimed before the insert so a concurrent purchase can't take the name
+            index[self.__fold(ship_name)] = ship
+            try:
+                ship.id = await asyncio.wrap_future(self._persistence.insert(ShipRow, ship.get_values()))
+            except:
+                del index[self.__fold(ship_name)]
+                character.add_credits(blueprint.get_cost())
+                raise
 
         return ship
 
-    def sell_ship(self, character, ship):
+    async def sell_ship(self, character, ship):
+        """Deletes one of the character's ships and refunds it. Returns False if it's already being sold."""
+        if ship.id in self._selling:
+            return False
+
+        # changes queued for the ship would only update a deleted row
+        changes = mapper.take_changes(ship)
+        self._selling.add(ship.id)
+        try:
+            await asyncio.wrap_future(self._persistence.delete(ShipRow, ship.id))
+        except:
+            if changes is not None:
+                ship.mark_dirty(*[c for c in changes if c != 'id'])
+            raise
+        finally:
+            self._selling.discard(ship.id)
+
+        self.__get_index(character).pop(self.__key(ship), None)
         character.add_credits(ship.get_cost())
-        database.session.delete(ship)
-        database.session.commit()
-
-    def __generate_ship_name(self, character):
-        """Generates a license plate-like name based on the given character"""
-        ship_name = '{}-{}'.format(
-            character.get_name()[:3].upper(),
-            str(abs(hash(datetime.datetime.now())))[:3]
-        )
-        return ship_name
-
-    
\ No newline at end of file
+        return True
+
+    def __generate_ship_name(self, character, index):
+        """
+        Generates a license plate-like name based on the given character
+        that none of their other ships have
+        """
+        prefix = character.get_name()[:3].upper()
+        digits = 3
+        while True:
+            for _ in range(10):
+                ship_name = '{}-{:0{}}'.format(prefix, random.randrange(10 ** digits), digits)
+                if self.__fold(ship_name) not in index:
+                    return ship_name
+            # running out of plates with this many digits
+            digits += 1
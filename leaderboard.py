@@ -0,0 +1,176 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import random
+
+class _SkiplistNode():
+    __slots__ = ('key', 'value', 'next', 'span')
+
+    def __init__(self, key, value, level):
+        self.key = key
+        self.value = value
+        self.next = [None] * level
+        self.span = [0] * level # positions skipped by following next at each level
+
+class IndexableSkiplist():
+    """
+    Sorted mapping of unique keys to values with expected O(log n) insert,
+    remove, rank lookup and access by rank.
+    """
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self._head = _SkiplistNode(None, None, self.MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def insert(self, key, value):
+        update = [None] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        x = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while x.next[i] is not None and x.next[i].key < key:
+                rank[i] += x.span[i]
+                x = x.next[i]
+            update[i] = x
+
+        level = self.__random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                update[i] = self._head
+                self._head.span[i] = self._size
+            self._level = level
+
+        node = _SkiplistNode(key, value, level)
+        for i in range(level):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._size += 1
+
+    def remove(self, key):
+        """Removes the given key. Raises KeyError if it isn't present."""
+        update = [None] * self._level
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and x.next[i].key < key:
+                x = x.next[i]
+            update[i] = x
+
+        x = x.next[0]
+        if x is None or x.key != key:
+            raise KeyError(key)
+
+        for i in range(self._level):
+            if update[i].next[i] is x:
+                update[i].span[i] += x.span[i] - 1
+                update[i].next[i] = x.next[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+
+    def get_rank(self, key):
+        """Gets the 0-based position of the given key, or None if it isn't present."""
+        rank = 0
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and x.next[i].key <= key:
+                rank += x.span[i]
+                x = x.next[i]
+        if x is not self._head and x.key == key:
+            return rank - 1
+        return None
+
+    def slice(self, start, count):
+        """Gets the (key, value) pairs of up to count entries from position start."""
+        if start < 0 or start >= self._size:
+            return []
+
+        traversed = 0
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and traversed + x.span[i] <= start + 1:
+                traversed += x.span[i]
+                x = x.next[i]
+
+        entries = []
+        while x is not None and len(entries) < count:
+            entries.append((x.key, x.value))
+            x = x.next[0]
+        return entries
+
+class Leaderboard():
+    """
+    Characters' owner ids ordered by XP, kept up to date as XP changes so that
+    pages and ranks never need the whole population to be sorted.
+    """
+
+    def __init__(self):
+        self._entries = IndexableSkiplist() # (-xp, id): owner_id
+        self._keys = {} # owner_id: key
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, character):
+        """Adds the character or moves it to its place for its current XP."""
+        key = (-character.get_xp(), character.id)
+        old = self._keys.get(character._owner_id)
+        if old == key:
+            return
+        if old is not None:
+            self._entries.remove(old)
+        self._entries.insert(key, character._owner_id)
+        self._keys[character._owner_id] = key
+
+    def remove(self, character):
+        key = self._keys.pop(character._owner_id, None)
+        if key is not None:
+            self._entries.remove(key)
+
+    def get_rank(self, character):
+        """Gets the character's 1-based rank, or None if it isn't on the leaderboard."""
+        key = self._keys.get(character._owner_id)
+        if key is None:
+            return None
+        return self._entries.get_rank(key) + 1
+
+    def get_top(self, count):
+        return self.get_page(0, count)
+
+    def get_page(self, page, page_size):
+        """Gets the owner ids of the characters on the given 0-based page."""
+        return [o for _, o in self._entries.slice(page * page_size, page_size)]
+
+    def get_page_count(self, page_size):
+        return max(1, -(-len(self._entries) // page_size))
@@ -0,0 +1,63 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Integer XP thresholds for the level curve level = (xp / 100) ^ (2 / 3) + 1.
+# Reaching level k + 1 takes 100 * k ^ 1.5 XP, which is ceil(sqrt(10000 * k ^ 3))
+# for whole XP values, so the table is exact on every platform.
+
+from bisect import bisect_right
+from math import isqrt
+
+_thresholds = [0] # XP needed for level i + 1
+
+def _extend(xp):
+    """Extends the table until it covers the given XP total."""
+    while _thresholds[-1] <= xp:
+        k = len(_thresholds)
+        n = 10000 * k ** 3
+        root = isqrt(n)
+        _thresholds.append(root if root * root == n else root + 1)
+
+def get_level(xp):
+    """Gets the level for an XP total."""
+    if _thresholds[-1] <= xp:
+        _extend(xp)
+    return bisect_right(_thresholds, xp)
+
+def get_xp_for_level(level):
+    """Gets the XP total needed to reach a level."""
+    while len(_thresholds) < level:
+        _extend(_thresholds[-1])
+    return _thresholds[level - 1]
+
+def get_level_ups(levels, xps):
+    """
+    Batched level-up detection. Takes each entry's current level and new XP total.
+    Returns (index, levels gained) for every entry that levelled up.
+    """
+    if xps:
+        _extend(max(xps))
+
+    level_ups = []
+    for i, (level, xp) in enumerate(zip(levels, xps)):
+        # most gains don't reach the next threshold
+        if level < len(_thresholds) and xp < _thresholds[level]:
+            continue
+        new_level = bisect_right(_thresholds, xp)
+        if new_level > level:
+            level_ups.append((i, new_level - level))
+    return level_ups
@@ -48,6 +48,14 @@ async def on_ready():
 async def shutdown():
     """[ADMIN] Shuts down the bot."""
     print('Shutting down Discord bot.')
+    cogs = list(bot.cogs.values())
+    for extension in list(bot.extensions):
+        bot.unload_extension(extension)
+    # let the cogs finish sending what they had queued
+    for cog in cogs:
+        wait_closed = getattr(cog, 'wait_closed', None)
+        if wait_closed is not None:
+            await wait_closed()
     await bot.close()
 
 @bot.command(pass_context = True)
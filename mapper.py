@@ -0,0 +1,138 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Maps the plain objects that hold live game state to the ORM rows they are
+# stored as. The game only ever works with the runtime objects; rows exist
+# inside queries and the persistence worker.
+
+_row_classes = {} # runtime class: row class
+_columns = {} # runtime class: column attribute names, primary key first
+
+# objects with changes that haven't been written to the DB yet
+_dirty_objects = set()
+
+class RuntimeModel():
+    """
+    Base for slotted runtime objects. Tracks which column attributes changed
+    since the last save without going through ORM instrumentation.
+    """
+    __slots__ = ('_dirty_columns', '_version', '_rendered_card') # _rendered_card is RenderCache's memo
+
+    def init_on_load(self):
+        """Sets up the non-column state of an object built from stored values."""
+        pass
+
+    def mark_dirty(self, *columns):
+        """Records that the given column attributes have changed since the last save."""
+        dirty = getattr(self, '_dirty_columns', None)
+        if dirty is None:
+            dirty = self._dirty_columns = set()
+        dirty.update(columns)
+        _dirty_objects.add(self)
+        self._version = getattr(self, '_version', 0) + 1
+
+    def get_version(self):
+        """Gets a counter that changes whenever the object is marked dirty."""
+        return getattr(self, '_version', 0)
+
+    def get_changes(self):
+        """Gets a mapping of the primary key and every changed column attribute."""
+        changes = {c: getattr(self, c) for c in self._dirty_columns}
+        changes['id'] = self.id
+        return changes
+
+    def get_values(self):
+        """Gets a mapping of every column attribute except the primary key, for inserts."""
+        return {c: getattr(self, c) for c in _columns[type(self)][1:]}
+
+def register(runtime_class, row_class):
+    """Maps a runtime class to the ORM class of its table. Column attributes must have the same names."""
+    columns = [c.key for c in row_class.__table__.columns]
+    columns.remove('id')
+    _row_classes[runtime_class] = row_class
+    _columns[runtime_class] = ('id',) + tuple(columns)
+
+def get_row_class(runtime_class):
+    return _row_classes[runtime_class]
+
+def get_columns(runtime_class):
+    """Gets the column attribute names of a runtime class, primary key first."""
+    return _columns[runtime_class]
+
+def build(runtime_class, values):
+    """Creates a runtime object from a mapping of every column attribute, like loading it."""
+    obj = runtime_class.__new__(runtime_class)
+    for column in _columns[runtime_class]:
+        setattr(obj, column, values[column])
+    obj.init_on_load()
+    return obj
+
+def query(session, runtime_class, *criteria, order_by = None):
+    """
+    Loads runtime objects matching the given criteria. Only column values are
+    selected, so the session never tracks any rows.
+    """
+    row_class = _row_classes[runtime_class]
+    columns = _columns[runtime_class]
+    q = session.query(*[getattr(row_class, c) for c in columns]).filter(*criteria)
+    if order_by is not None:
+        q = q.order_by(order_by)
+    return [build(runtime_class, dict(zip(columns, row))) for row in q]
+
+def discard_changes(obj):
+    """Forgets the unsaved changes of an object that's being deleted."""
+    _dirty_objects.discard(obj)
+
+def take_changes(obj):
+    """Takes the unsaved changes of a single object. Returns None if it has none."""
+    if obj not in _dirty_objects:
+        return None
+    _dirty_objects.discard(obj)
+    changes = obj.get_changes()
+    obj._dirty_columns = set()
+    return changes
+
+def is_dirty(obj):
+    """Checks whether an object has changes that haven't been taken for a save."""
+    return obj in _dirty_objects
+
+def collect_changes(objects = None):
+    """
+    Takes the changes of every dirty object so they can be written.
+    Returns a dict of row class: list(changes). If a dict is given, the objects
+    are added to it by (row class, id), for restore_changes should the write fail.
+    """
+    changes = {}
+    for obj in _dirty_objects:
+        row_class = _row_classes[type(obj)]
+        changes.setdefault(row_class, []).append(obj.get_changes())
+        obj._dirty_columns = set()
+        if objects is not None:
+            objects[row_class, obj.id] = obj
+    _dirty_objects.clear()
+    return changes
+
+def restore_changes(changes, objects):
+    """
+    Marks changes that couldn't be written as unsaved again, so the next save
+    writes the objects' current values. objects is the dict filled by collect_changes.
+    """
+    for row_class, rows in changes.items():
+        for change in rows:
+            obj = objects.get((row_class, change['id']))
+            if obj is not None:
+                obj.mark_dirty(*[c for c in change if c != 'id'])
@@ -15,79 +15,58 @@ You should have received a copy of the GNU General Public License
 along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import character
+import content_cache
+import content_sync
 import database
-import json_util
-from mission import Mission
-import random
-from sqlalchemy import orm
+from mission_graph import MissionGraph
+from mission_selector import MissionSelector
 
 class MissionControl():
     """
     Class that tracks and controls mission behavior
     """
 
-    def __init__(self):
-        self._mission_tree = json_util.read_object_from_file('missions.json')
+    def __init__(self, mission_paths = ('missions.json',), sync_batch_size = 500):
+        self._mission_paths = mission_paths # mission json files and directories of them
+        self._sync_batch_size = sync_batch_size
+        self._mission_graph = None
+        self._selector = None
 
     def update_db_missions(self):
         """
-        Updates the DB with missions read from the missions json file
+        Updates the DB with missions read from the mission json files
+        and loads the mission graph from it
         """
-        self.__update_db_missions(self._mission_tree)
-        database.session.commit()
+        print(self.sync_missions())
+        self.set_mission_graph(MissionGraph.load(database.session))
 
-    def generate_mission_for(self, character):
-        """
-        Generates a mission for the given character.
-        """
-        print('generating mission')
-        current_mission = character.get_current_mission()
-        mission_choices = []
+    def sync_missions(self, force = False, session = None, commit = True):
+        """Syncs the mission json files into the DB. Returns a content_sync.SyncResult."""
+        return content_sync.sync_missions(self._mission_paths, force, self._sync_batch_size, session, commit)
 
-        if current_mission is not None:
-            # Choose from branching missions if any
-            mission_choices = current_mission._branches
+    def get_mission_files(self):
+        """Gets every mission json file, with directories expanded."""
+        return content_cache.find_content_files(self._mission_paths)
 
-        if len(mission_choices) == 0:
-            # Choose from root missions
-            mission_choices = database.session.query(Mission).filter(Mission._parent_id == None).all()
-        
-        print('queried {} missions'.format(len(mission_choices)))
+    def get_mission_graph(self):
+        return self._mission_graph
 
-        new_mission = self.__choose_mission_from(mission_choices)
-        database.session.expunge(new_mission)
-        print('got mission {}'.format(new_mission._name))
+    def set_mission_graph(self, mission_graph):
+        # the selection tables only change with the content, so build them once here
+        self._selector = MissionSelector(mission_graph)
+        self._mission_graph = mission_graph
 
-        return new_mission
-
-    def __update_db_missions(self, mission_tree):
+    def generate_mission_for(self, character):
         """
-        Postorder traversal of a list of MissionJson objects that converts them into
-        missions that are stored in the DB.  Recursive.
+        Generates a mission for the given character: one of the branches of its
+        current mission, or a root mission if there are none, chosen by weight
+        from those its tier is eligible for.
         """
-        parent_dbm_list = []
-
-        for mission in mission_tree:
-            # recurse down to leaf nodes
-            child_dbm_list = self.__update_db_missions(mission.branches)
+        return self._selector.choose(character.get_current_mission(), character.get_tier())
 
-            db_mission = None
-
-            try:
-                # update existing missions
-                db_mission = database.session.query(Mission).filter(Mission._name == mission.name).one()
-                db_mission.update_data(mission)
-            except orm.exc.NoResultFound:
-                # add new mission
-                db_mission = Mission(mission)
-                database.session.add(db_mission)
-
-            db_mission._branches = child_dbm_list
-            parent_dbm_list.append(db_mission)
-
-        return parent_dbm_list
-
-    def __choose_mission_from(self, mission_list):
-        # for now just get a random one
-        return random.choice(mission_list)
+    def generate_missions_for(self, characters):
+        """
+        Generates the next missions for many characters at once.
+        Returns the missions in the same order as the characters.
+        """
+        return self._selector.choose_many([(c.get_current_mission(), c.get_tier()) for c in characters])
@@ -0,0 +1,133 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import namedtuple
+import random
+
+from mission import Mission
+
+_MissionNodeBase = namedtuple('MissionNode', [
+    'id', 'name', 'description', 'epilogue', 'xp_reward', 'time_required', 'tier', 'parent_id', 'weight'],
+    defaults = (1.0,))
+
+class MissionNode(_MissionNodeBase):
+    """
+    Immutable catalog entry for a mission. A single node is shared by every
+    character on that mission, so it never holds per-character state.
+    """
+    __slots__ = ()
+
+    def get_name(self):
+        return self.name
+
+    def get_time_required(self):
+        return self.time_required
+
+    def get_progress_percent(self, ticks):
+        """
+        Gets the progress of a mission that has run for the given ticks as a percentage
+        """
+        return min(100, int(ticks * 100 / self.time_required))
+
+    def get_variable_xp_reward(self):
+        """
+        Gets an XP value that is +/- 10% of the base value
+        """
+        start = int(self.xp_reward * 0.9)
+        end = int(self.xp_reward * 1.1) + 1   # + 1 since randrange excludes the end value
+        return random.randrange(start, end)
+
+    def get_info_card(self):
+        """
+        Gets a string that that presents all the mission data
+        """
+        lines = []
+        lines.append('Name:         {}'.format(self.name))
+        lines.append('Description:  {}'.format(self.description))
+        lines.append('Tier:         {}'.format(self.tier))
+        lines.append('Base XP:      {}'.format(self.xp_reward))
+        lines.append('ETC:          {} seconds'.format(self.time_required))
+        return '\n'.join(lines)
+
+class MissionProgress():
+    """
+    A character's progress through a mission.
+    """
+    __slots__ = ('mission', 'started', 'start_tick')
+
+    def __init__(self, mission, started, start_tick = 0):
+        self.mission = mission # MissionNode
+        self.started = started # unix timestamp
+        self.start_tick = start_tick # scheduler tick
+
+    def rebind(self, mission_graph):
+        """
+        Points the mission at its node in a reloaded mission graph.
+        Returns False if the mission was removed, in which case the old node is kept.
+        """
+        mission = mission_graph.get(self.mission.id)
+        if mission is None or mission.name != self.mission.name:
+            return False
+        self.mission = mission
+        return True
+
+class MissionGraph():
+    """
+    Read-only, indexed view of the whole mission tree, loaded once from the DB
+    so choosing a mission never needs a query.
+    """
+
+    def __init__(self, nodes):
+        self._nodes = {} # id: MissionNode
+        children = {} # parent id: list(MissionNode)
+        tiers = {} # tier: list(MissionNode)
+
+        for n in sorted(nodes, key = lambda n: n.id):
+            self._nodes[n.id] = n
+            children.setdefault(n.parent_id, []).append(n)
+            tiers.setdefault(n.tier, []).append(n)
+
+        self._roots = tuple(children.pop(None, []))
+        self._children = {parent: tuple(c) for parent, c in children.items()}
+        self._tiers = {tier: tuple(t) for tier, t in tiers.items()}
+
+    @classmethod
+    def load(cls, session):
+        """Loads every mission from the DB in a single query."""
+        rows = session.query(Mission.id, Mission._name, Mission._description, Mission._epilogue,
+            Mission._xp_reward, Mission._time_required, Mission._tier, Mission._parent_id, Mission._weight).all()
+        # missions stored before weights existed have none
+        return cls(MissionNode(*row[:-1], 1.0 if row[-1] is None else row[-1]) for row in rows)
+
+    def get(self, mission_id):
+        """Gets the mission with the given id, or None if it doesn't exist."""
+        return self._nodes.get(mission_id)
+
+    def get_roots(self):
+        return self._roots
+
+    def get_branches(self, mission):
+        return self._children.get(mission.id, ())
+
+    def get_tier(self, tier):
+        return self._tiers.get(tier, ())
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __iter__(self):
+        return iter(self._nodes.values())
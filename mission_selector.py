@@ -0,0 +1,128 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import random
+
+class AliasTable():
+    """
+    Weighted random choice in constant time, using Walker's alias method
+    (Vose's construction). Building the table is O(n).
+    """
+    __slots__ = ('_items', '_prob', '_alias')
+
+    def __init__(self, items, weights):
+        n = len(items)
+        total = sum(weights)
+        if total <= 0:
+            # nothing is weighted, so every item is as likely
+            weights = [1] * n
+            total = n
+
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] += scaled[s] - 1
+            (small if scaled[l] < 1 else large).append(l)
+        # whatever is left is 1 up to rounding error, and keeps prob 1.0
+
+        self._items = tuple(items)
+        self._prob = prob
+        self._alias = alias
+
+    def __len__(self):
+        return len(self._items)
+
+    def sample(self):
+        i = int(random.random() * len(self._items))
+        return self._items[i] if random.random() < self._prob[i] else self._items[self._alias[i]]
+
+    def sample_many(self, count):
+        items = self._items
+        prob = self._prob
+        alias = self._alias
+        n = len(items)
+        rand = random.random
+        picks = []
+        for _ in range(count):
+            i = int(rand() * n)
+            picks.append(items[i] if rand() < prob[i] else items[alias[i]])
+        return picks
+
+class MissionSelector():
+    """
+    Chooses next missions from alias tables that are built once per mission graph.
+    There's a table for every (parent mission, tier) bucket: the parent's branches,
+    or the root missions for a mission without branches, that a character of that
+    tier is eligible for, weighted by each mission's weight.
+    """
+
+    def __init__(self, mission_graph):
+        self._mission_graph = mission_graph
+        self._tiers = sorted(set(m.tier for m in mission_graph)) # tiers that have missions
+        self._tables = {} # (parent id or None for roots, tier or None for ineligible): AliasTable
+
+        self.__add_tables(None, mission_graph.get_roots())
+        for m in mission_graph:
+            branches = mission_graph.get_branches(m)
+            if branches:
+                self.__add_tables(m.id, branches)
+
+    def __add_tables(self, parent_id, choices):
+        if not choices:
+            return
+        everything = AliasTable(choices, [m.weight for m in choices])
+        self._tables[parent_id, None] = everything
+        for tier in self._tiers:
+            eligible = [m for m in choices if m.tier <= tier]
+            # a character that isn't eligible for any branch still gets to continue
+            self._tables[parent_id, tier] = AliasTable(eligible, [m.weight for m in eligible]) if eligible else everything
+
+    def __get_table(self, current_mission, tier):
+        parent_id = None
+        if current_mission is not None and self._mission_graph.get_branches(current_mission):
+            parent_id = current_mission.id
+
+        # characters use the table of the highest mission tier they've reached
+        i = bisect.bisect_right(self._tiers, tier if tier is not None else 0) - 1
+        return self._tables[parent_id, self._tiers[i] if i >= 0 else None]
+
+    def choose(self, current_mission, tier):
+        """Chooses the mission that follows current_mission (None to start over) for a character of the given tier."""
+        return self.__get_table(current_mission, tier).sample()
+
+    def choose_many(self, requests):
+        """
+        Chooses next missions for many characters at once.
+        requests is a list of (current mission, tier). Returns the chosen missions in the same order.
+        """
+        buckets = {} # table: list(request index)
+        for i, (current_mission, tier) in enumerate(requests):
+            buckets.setdefault(self.__get_table(current_mission, tier), []).append(i)
+
+        chosen = [None] * len(requests)
+        for table, indexes in buckets.items():
+            for i, mission in zip(indexes, table.sample_many(len(indexes))):
+                chosen[i] = mission
+        return chosen
@@ -0,0 +1,249 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from types import MappingProxyType
+
+from database import DbModel
+from sqlalchemy import Column, Integer, bindparam
+
+class SaveMark(DbModel):
+    """
+    Sequence number of the last write that the persistence worker committed,
+    so a world snapshot can tell whether the DB has been written since it was taken.
+    """
+    __tablename__ = 'save_mark'
+
+    id = Column(Integer, primary_key = True)
+    _sequence = Column(Integer, nullable = False)
+
+class PersistenceError(Exception):
+    """
+    Raised through an update's Future when some of its rows couldn't be written.
+    The rest were committed. failed is a dict of model: list(changes) of the rows that weren't.
+    """
+
+    def __init__(self, failed, cause):
+        Exception.__init__(self, '{} rows not written: {}'.format(sum(len(r) for r in failed.values()), cause))
+        self.failed = failed
+
+class _Update():
+    """A queued update of many rows, which can be split into one write per row."""
+    __slots__ = ('rows',)
+
+    def __init__(self, rows):
+        self.rows = rows # tuple((model, changes))
+
+    def __call__(self, session):
+        # core statements rather than bulk_update_mappings, so a row that was
+        # deleted since its change was queued is skipped instead of failing the batch
+        count = 0
+        groups = {} # (model, changed columns): list(changes)
+        for model, changes in self.rows:
+            groups.setdefault((model, tuple(sorted(changes))), []).append(changes)
+        for (model, columns), group in groups.items():
+            table = model.__table__
+            statement = table.update().where(table.c.id == bindparam('_id')).values(
+                {c: bindparam('_' + c) for c in columns if c != 'id'})
+            result = session.execute(statement, [{'_' + c: v for c, v in changes.items()} for changes in group])
+            count += result.rowcount
+        return count
+
+    def split(self):
+        return [_Update((row,)) for row in self.rows]
+
+class PersistenceWorker():
+    """
+    Write-behind persistence that commits on its own thread so that SQLite
+    never blocks the event loop.
+    The loop submits immutable snapshots of row data and gets back a Future
+    that completes once the write is durable. Operations that are queued
+    together are committed in one transaction. If that fails, they are retried
+    one at a time so that only the writes that fail on their own are lost.
+    Every write is numbered when it's submitted, and each commit records the
+    number of its last write in the DB's save mark.
+    """
+
+    _STOP = object()
+
+    def __init__(self, session_factory, max_batch = 500):
+        self._session_factory = session_factory
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target = self.__run, name = 'persistence', daemon = True)
+        self._sequence = self.__read_mark() # number of the last submitted write
+        table = SaveMark.__table__
+        self._mark = table.update().where(table.c.id == 1).values(_sequence = bindparam('sequence'))
+
+        # metrics, only written by the worker thread
+        self._commits = 0
+        self._operations = 0
+        self._failures = 0
+        self._last_commit = 0.0
+        self._max_commit = 0.0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout = None):
+        """Flushes every pending write and stops the worker thread."""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def insert(self, model, values):
+        """Inserts a row. The Future's result is the new primary key."""
+        values = MappingProxyType(dict(values))
+        return self.__submit(lambda session: session.execute(
+            model.__table__.insert(), dict(values)).inserted_primary_key[0])
+
+    def update(self, changes):
+        """
+        Updates rows from a dict of model: list(changes), where each change
+        maps the primary key and changed column attributes. The Future's result is the row count.
+        """
+        return self.__submit(_Update(tuple((model, MappingProxyType(dict(c)))
+            for model, rows in changes.items() for c in rows)))
+
+    def delete(self, model, id):
+        """Deletes the row with the given primary key."""
+        table = model.__table__
+        return self.__submit(lambda session: session.execute(
+            table.delete().where(table.c.id == id)).rowcount)
+
+    def get_sequence(self):
+        """
+        Gets the number of the last submitted write. The DB's save mark only matches
+        it once that write is committed and nothing has been written since.
+        """
+        return self._sequence
+
+    def get_report(self):
+        lines = []
+        lines.append('Pending writes:   {}'.format(self._queue.qsize()))
+        lines.append('Commits:          {} ({} operations, {} failed)'.format(
+            self._commits, self._operations, self._failures))
+        lines.append('Commit time:      last {:.1f} ms, max {:.1f} ms'.format(
+            self._last_commit * 1000, self._max_commit * 1000))
+        return '\n'.join(lines)
+
+    def __read_mark(self):
+        session = self._session_factory()
+        try:
+            mark = session.query(SaveMark).get(1)
+            if mark is None:
+                mark = SaveMark(id = 1, _sequence = 0)
+                session.add(mark)
+                session.commit()
+            return mark._sequence
+        finally:
+            session.close()
+
+    def __submit(self, operation):
+        future = Future()
+        self._sequence += 1
+        self._queue.put((operation, future, self._sequence))
+        return future
+
+    def __run(self):
+        session = self._session_factory()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self._max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if self._STOP in batch:
+                stopping = True
+                batch = [op for op in batch if op is not self._STOP]
+            if batch:
+                self.__commit(session, batch)
+
+        session.close()
+
+    def __commit(self, session, batch):
+        start = time.monotonic()
+        results = []
+        try:
+            for operation, _, _ in batch:
+                results.append(operation(session))
+            session.execute(self._mark, {'sequence': batch[-1][2]})
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print('Unable to commit {} queued writes together, retrying them one at a time: {}'.format(len(batch), e))
+            for operation, future, sequence in batch:
+                self.__commit_alone(session, operation, future, sequence)
+            return
+
+        self._commits += 1
+        self._operations += len(batch)
+        self._last_commit = time.monotonic() - start
+        self._max_commit = max(self._max_commit, self._last_commit)
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def __commit_alone(self, session, operation, future, sequence):
+        """Commits a single write. An update that fails is retried a row at a time."""
+        try:
+            result = operation(session)
+            session.execute(self._mark, {'sequence': sequence})
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if not isinstance(operation, _Update) or len(operation.rows) == 1:
+                self._failures += 1
+                print('Unable to commit a queued write: {}'.format(e))
+                future.set_exception(e)
+                return
+            self.__commit_rows(session, operation, future, sequence)
+            return
+
+        self._commits += 1
+        self._operations += 1
+        future.set_result(result)
+
+    def __commit_rows(self, session, operation, future, sequence):
+        count = 0
+        failed = {}
+        cause = None
+        for part in operation.split():
+            try:
+                count += part(session)
+                session.execute(self._mark, {'sequence': sequence})
+                session.commit()
+                self._commits += 1
+            except Exception as e:
+                session.rollback()
+                model, changes = part.rows[0]
+                failed.setdefault(model, []).append(dict(changes))
+                cause = e
+
+        self._operations += 1
+        if failed:
+            error = PersistenceError(failed, cause)
+            self._failures += 1
+            print('Unable to commit a queued update: {}'.format(error))
+            future.set_exception(error)
+        else:
+            future.set_result(count)
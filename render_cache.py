@@ -0,0 +1,88 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+class RenderCache():
+    """
+    Caches rendered info cards.
+    Blueprint and mission cards only change when content is loaded, so they are
+    rendered up front. Ship and character cards are kept on the object and
+    rendered again only once its version (bumped by mark_dirty) or something
+    else shown on the card changes.
+    """
+    KINDS = ('blueprint', 'mission', 'ship', 'character')
+
+    def __init__(self):
+        self._blueprints = {} # id: card
+        self._missions = {} # MissionNode: card
+        self._hits = dict.fromkeys(self.KINDS, 0)
+        self._misses = dict.fromkeys(self.KINDS, 0)
+
+    def prerender_blueprints(self, blueprints):
+        self._blueprints = {b.id: b.get_info_card() for b in blueprints}
+
+    def prerender_missions(self, mission_graph):
+        # nodes are immutable and compare by value, so a removed node never finds a new card
+        self._missions = {m: m.get_info_card() for m in mission_graph}
+
+    def __get_static(self, kind, cards, key, obj):
+        card = cards.get(key)
+        if card is None:
+            # not loaded with the current content, e.g. a mission that was removed
+            self._misses[kind] += 1
+            return obj.get_info_card()
+        self._hits[kind] += 1
+        return card
+
+    def __get_memoized(self, kind, obj, key, render):
+        """Gets the card memoized on obj if it was rendered for the same key."""
+        memo = getattr(obj, '_rendered_card', None)
+        if memo is not None and memo[0] == key:
+            self._hits[kind] += 1
+            return memo[1]
+
+        self._misses[kind] += 1
+        card = render()
+        obj._rendered_card = (key, card)
+        return card
+
+    def get_blueprint_card(self, blueprint):
+        return self.__get_static('blueprint', self._blueprints, blueprint.id, blueprint)
+
+    def get_mission_card(self, mission):
+        return self.__get_static('mission', self._missions, mission, mission)
+
+    def get_ship_card(self, ship):
+        # blueprint cards are replaced when content is reloaded
+        key = (ship.get_version(), self._blueprints.get(ship._blueprint_id))
+        return self.__get_memoized('ship', ship, key, ship.get_info_card)
+
+    def get_character_card(self, character, progress_ticks):
+        mission = character.get_current_mission()
+        ship = character.get_current_ship()
+        key = (character.get_version(), mission.get_progress_percent(progress_ticks),
+            None if ship is None else (ship.id, ship.get_version()))
+        return self.__get_memoized('character', character, key, lambda: character.get_info_card(progress_ticks))
+
+    def get_report(self):
+        lines = []
+        for kind in self.KINDS:
+            hits = self._hits[kind]
+            total = hits + self._misses[kind]
+            rate = hits * 100 / total if total else 0
+            lines.append('{:<12}{:>8} hits {:>8} misses ({:.1f}% hit rate)'.format(
+                kind.capitalize() + ':', hits, self._misses[kind], rate))
+        return '\n'.join(lines)
@@ -0,0 +1,133 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import OrderedDict
+import discord
+import time
+
+import discord_output
+
+class ResolutionCache():
+    """
+    LRU cache with per-entry expiry. Lookups that found nothing are cached
+    too (as None) for a shorter time so repeated misses stay cheap.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_size = 10000, ttl = 3600, negative_ttl = 300):
+        self._entries = OrderedDict() # key: (value, expiry time)
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Gets a cached value, which may be None for a cached miss.
+        Returns ResolutionCache._MISSING when the key has to be looked up.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                if value is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return value
+            del self._entries[key]
+
+        self.misses += 1
+        return self._MISSING
+
+    def put(self, key, value):
+        ttl = self._ttl if value is not None else self._negative_ttl
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last = False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_report(self):
+        lookups = self.hits + self.negative_hits + self.misses
+        rate = (self.hits + self.negative_hits) * 100 / lookups if lookups > 0 else 0
+        return '{} cached, {} hits, {} negative hits, {} misses ({:.1f}% hit rate), {} evictions'.format(
+            len(self._entries), self.hits, self.negative_hits, self.misses, rate, self.evictions)
+
+    @classmethod
+    def is_missing(cls, value):
+        return value is cls._MISSING
+
+class DiscordResolver():
+    """
+    Caches Discord user and channel lookups for outbound messages so a busy tick
+    doesn't pay an API round-trip per recipient.
+    """
+
+    def __init__(self, bot, max_size = 10000, ttl = 3600, negative_ttl = 300):
+        self._bot = bot
+        self._users = ResolutionCache(max_size, ttl, negative_ttl)
+        self._channels = ResolutionCache(max_size, ttl, negative_ttl)
+
+    async def get_user(self, user_id):
+        """Gets the user with the given id, or None if it doesn't exist."""
+        user = self._users.get(user_id)
+        if ResolutionCache.is_missing(user):
+            try:
+                user = await self._bot.get_user_info(user_id)
+            except discord.NotFound:
+                user = None
+            self._users.put(user_id, user)
+        return user
+
+    def get_channel(self, channel_id):
+        """Gets the channel with the given id, or None if the bot can't see it."""
+        channel = self._channels.get(channel_id)
+        if ResolutionCache.is_missing(channel):
+            channel = self._bot.get_channel(channel_id)
+            if channel is None:
+                discord_output.print_missing_channel(self._bot, channel_id)
+            self._channels.put(channel_id, channel)
+        return channel
+
+    def invalidate_user(self, user_id):
+        self._users.invalidate(user_id)
+
+    def invalidate_channel(self, channel_id):
+        self._channels.invalidate(channel_id)
+
+    def clear(self):
+        self._users.clear()
+        self._channels.clear()
+
+    def get_report(self):
+        lines = []
+        lines.append('User cache:       {}'.format(self._users.get_report()))
+        lines.append('Channel cache:    {}'.format(self._channels.get_report()))
+        return '\n'.join(lines)
@@ -0,0 +1,240 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import OrderedDict
+
+from character import Character, CharacterRow
+import mapper
+
+class DormantCharacter():
+    """
+    Compact stand-in for a character that hasn't been active recently.
+    Holds the column values and mission progress, which is all the scheduler,
+    the leaderboard and the world snapshot need, and can be turned back into a
+    full Character without touching the DB.
+    """
+    COLUMNS = mapper.get_columns(Character)
+    __slots__ = COLUMNS + ('_level', '_mission_progress')
+
+    @classmethod
+    def from_character(cls, character):
+        d = cls()
+        for column in cls.COLUMNS:
+            setattr(d, column, getattr(character, column))
+        d._level = character._level
+        d._mission_progress = character._mission_progress
+        return d
+
+    def to_character(self):
+        """Rebuilds the full character. Its current ship is left for the caller to load."""
+        c = mapper.build(Character, {column: getattr(self, column) for column in self.COLUMNS})
+        c._mission_progress = self._mission_progress
+        return c
+
+    def __repr__(self):
+        return '<DormantCharacter(name = {}, xp = {}, owner_id = {})>'.format(
+            self._name, self._xp, self._owner_id)
+
+    def get_level(self):
+        return self._level
+
+    def get_xp(self):
+        return self._xp
+
+    def get_name(self):
+        return self._name
+
+    def get_credits(self):
+        return self._credits
+
+    def get_current_ship(self):
+        # ships are only loaded for resident characters
+        return None
+
+    def get_current_mission(self):
+        return None if self._mission_progress is None else self._mission_progress.mission
+
+    def get_mission_progress(self):
+        return self._mission_progress
+
+    def rebind_mission(self, mission_graph):
+        return self._mission_progress is None or self._mission_progress.rebind(mission_graph)
+
+class Roster():
+    """
+    Every character in the game, keyed by owner id.
+    Only the characters that issued a command most recently are kept as full
+    objects, up to a capacity. The rest are DormantCharacters, and are turned
+    back into Characters when a command or a mission completion needs them.
+    Unsaved changes of a character that goes dormant are held until the next save.
+    """
+
+    def __init__(self, hangar, capacity):
+        self._hangar = hangar
+        self._capacity = max(1, capacity)
+        self._entries = {} # owner_id: Character or DormantCharacter
+        self._resident = OrderedDict() # owner ids of recently active characters, least recent first
+        self._borrowed = [] # owner ids materialised for a mission completion
+        self._pinned = {} # owner id: number of commands holding the character across an await
+        self._evicted_changes = {} # character id: unsaved changes
+
+        # metrics
+        self._materialized = 0
+        self._evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, owner_id):
+        return owner_id in self._entries
+
+    def values(self):
+        """Gets every character, full or dormant."""
+        return self._entries.values()
+
+    def peek(self, owner_id):
+        """Gets the character as it's currently held, without materialising it."""
+        return self._entries[owner_id]
+
+    def add(self, character):
+        """Adds a character as recently active."""
+        self._entries[character._owner_id] = character
+        self.__touch(character._owner_id)
+
+    def remove(self, owner_id):
+        """Stops tracking a character and drops its unsaved changes. Returns it as it was held."""
+        self._resident.pop(owner_id, None)
+        character = self._entries.pop(owner_id)
+        self._evicted_changes.pop(character.id, None)
+        return character
+
+    def get(self, owner_id):
+        """Gets the full character for a command, marking it as recently active."""
+        character = self.__materialize(owner_id)
+        if character._current_ship_id is not None and character._current_ship is None:
+            character._current_ship = self._hangar.get_ship(character, character._current_ship_id)
+        self.__touch(owner_id)
+        return character
+
+    def pin(self, owner_id):
+        """
+        Gets the full character like get(), and keeps it from going dormant until
+        unpin(). For commands that hold on to the character across an await.
+        """
+        character = self.get(owner_id)
+        self._pinned[owner_id] = self._pinned.get(owner_id, 0) + 1
+        return character
+
+    def unpin(self, owner_id):
+        count = self._pinned.pop(owner_id, 0) - 1
+        if count > 0:
+            self._pinned[owner_id] = count
+        elif owner_id in self._resident:
+            self.__trim()
+
+    def borrow(self, owner_id):
+        """
+        Gets the full character for a mission completion without marking it as
+        active. It goes dormant again on release() unless a command needs it first.
+        """
+        character = self.__materialize(owner_id)
+        if owner_id not in self._resident:
+            self._borrowed.append(owner_id)
+        return character
+
+    def release(self):
+        """Puts the characters borrowed since the last release back to sleep."""
+        for owner_id in self._borrowed:
+            if owner_id in self._entries and owner_id not in self._resident:
+                self.__demote(owner_id)
+        self._borrowed = []
+
+    def __materialize(self, owner_id):
+        character = self._entries[owner_id]
+        if isinstance(character, DormantCharacter):
+            character = character.to_character()
+            self._entries[owner_id] = character
+            self._materialized += 1
+        return character
+
+    def __touch(self, owner_id):
+        self._resident[owner_id] = None
+        self._resident.move_to_end(owner_id)
+        self.__trim()
+
+    def __trim(self):
+        pinned = []
+        while self._resident and len(self._resident) + len(pinned) > self._capacity:
+            evicted, _ = self._resident.popitem(last = False)
+            if evicted in self._pinned:
+                pinned.append(evicted)
+            else:
+                self.__demote(evicted)
+        # pinned characters keep their place
+        for owner_id in reversed(pinned):
+            self._resident[owner_id] = None
+            self._resident.move_to_end(owner_id, last = False)
+
+    def __demote(self, owner_id):
+        character = self._entries[owner_id]
+        if isinstance(character, DormantCharacter):
+            return
+        self._entries[owner_id] = DormantCharacter.from_character(character)
+        if self._hangar is not None:
+            self._hangar.release_owner(character)
+        changes = mapper.take_changes(character)
+        if changes is not None:
+            self._evicted_changes.setdefault(character.id, {}).update(changes)
+        self._evicted += 1
+
+    def take_changes(self):
+        """
+        Takes the unsaved changes of characters that went dormant, as a dict of row class: list(changes).
+        They have to be written before the changes from mapper.collect_changes().
+        """
+        if not self._evicted_changes:
+            return {}
+        changes = {CharacterRow: list(self._evicted_changes.values())}
+        self._evicted_changes = {}
+        return changes
+
+    def restore_changes(self, changes):
+        """
+        Marks character changes that couldn't be written as unsaved again, with the
+        current values of the characters that still exist.
+        """
+        failed = {change['id']: change for change in changes.get(CharacterRow, ())}
+        if not failed:
+            return
+        for character in self._entries.values():
+            change = failed.get(character.id)
+            if change is None:
+                continue
+            columns = [c for c in change if c != 'id']
+            if isinstance(character, DormantCharacter):
+                pending = self._evicted_changes.setdefault(character.id, {'id': character.id})
+                pending.update((c, getattr(character, c)) for c in columns)
+            else:
+                character.mark_dirty(*columns)
+
+    def get_report(self):
+        lines = []
+        lines.append('Characters:       {} ({} resident, cap {})'.format(
+            len(self._entries), len(self._resident), self._capacity))
+        lines.append('Materialised:     {}'.format(self._materialized))
+        lines.append('Put to sleep:     {}'.format(self._evicted))
+        return '\n'.join(lines)
@@ -0,0 +1,74 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import heapq
+
+class MissionScheduler():
+    """
+    Tracks the completion deadline of every active mission in a priority queue
+    so a game tick only has to touch the characters whose missions finish.
+    Deadlines are measured in game ticks.
+    """
+
+    def __init__(self):
+        self._tick = 0
+        self._heap = [] # (deadline, owner_id)
+        self._deadlines = {} # owner_id: deadline
+
+    def get_tick(self):
+        return self._tick
+
+    def schedule(self, character):
+        """
+        (Re)schedules the character's current mission, taking into account
+        any progress it has already made.
+        """
+        progress = character.get_mission_progress()
+        remaining = max(1, progress.mission.get_time_required() - character._current_mission_ticks)
+        deadline = self._tick + remaining
+        progress.start_tick = deadline - progress.mission.get_time_required()
+
+        self._deadlines[character._owner_id] = deadline
+        heapq.heappush(self._heap, (deadline, character._owner_id))
+
+    def unschedule(self, character):
+        """Stops tracking the character's current mission."""
+        self._deadlines.pop(character._owner_id, None)
+
+    def advance(self):
+        """
+        Advances the clock one tick and returns the owner ids of all
+        characters whose missions are due.
+        """
+        self._tick += 1
+        due = []
+
+        while self._heap and self._heap[0][0] <= self._tick:
+            deadline, owner_id = heapq.heappop(self._heap)
+            # entries are invalidated lazily when a mission is rescheduled or dropped
+            if self._deadlines.get(owner_id) == deadline:
+                del self._deadlines[owner_id]
+                due.append(owner_id)
+
+        return due
+
+    def get_progress_ticks(self, character):
+        """Computes the number of ticks the character has spent on its current mission."""
+        return self._tick - character.get_mission_progress().start_tick
+
+    def __len__(self):
+        return len(self._deadlines)
@@ -15,11 +15,10 @@ You should have received a copy of the GNU General Public License
 along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from cargo import Cargo
 from database import DbModel
 from flight_status import FlightStatus
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey
-from sqlalchemy.orm import relationship
+import mapper
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Index
 
 class ShipJson(object):
     def __init__(self, model, cost, mass, cargo_capacity, fuel_capacity, weapon_hardpoints, aux_hardpoints, description):
@@ -39,7 +38,7 @@ class ShipBlueprint(DbModel):
     __tablename__ = 'ship_blueprint'
 
     id = Column(Integer, primary_key = True)
-    _model = Column(String)
+    _model = Column(String, index = True, unique = True)
     _cost = Column(Integer)
     _mass = Column(Integer)
     _cargo_capacity = Column(Integer)
@@ -78,29 +77,42 @@ class ShipBlueprint(DbModel):
         lines.append('Auxilliary hardpoints:    {}'.format(self._aux_hardpoints))
         return '\n'.join(lines)
 
-class Ship(DbModel):
+class ShipRow(DbModel):
     """
-    Class that models an instance of ship the player can own/fly
+    Stored form of a Ship, only used by queries and the persistence worker.
     """
     __tablename__ = 'ship'
+    __table_args__ = (Index('ix_ship_owner_name', '_owner_id', '_name', unique = True),)
 
     id = Column(Integer, primary_key = True)
-    _owner_id = Column(String) # Character ID
+    _owner_id = Column(String, index = True) # Character ID
     _name = Column(String)
     _blueprint_id = Column(Integer, ForeignKey('ship_blueprint.id'))
-    _blueprint = relationship('ShipBlueprint', lazy = 'joined')
     _flight_status = Column(Enum(FlightStatus))
-    _cargo = relationship('Cargo', backref = 'stored_in', lazy = 'joined')
+
+class Ship(mapper.RuntimeModel):
+    """
+    Class that models an instance of ship the player can own/fly
+    """
+    __slots__ = ('id', '_owner_id', '_name', '_blueprint_id', '_flight_status', '_blueprint', '_cargo')
 
     def __init__(self, owner_id, blueprint, name):
+        self.id = None
         self._owner_id = owner_id
+        self._blueprint_id = blueprint.id
         self._blueprint = blueprint
         self._name = name
         self._flight_status = FlightStatus.DOCKED
         self._cargo = []
 
+    def init_on_load(self):
+        # the hangar attaches the blueprint and cargo
+        self._blueprint = None
+        self._cargo = []
+
     def set_name(self, name):
         self._name = name
+        self.mark_dirty('_name')
 
     def get_name(self):
         return self._name
@@ -127,3 +139,5 @@ class Ship(DbModel):
         lines.append('Flight status:            {}'.format(self._flight_status.name))
         lines.append('Cargo items:              {}'.format(len(self._cargo)))
         return '\n'.join(lines)
+
+mapper.register(Ship, ShipRow)
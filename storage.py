@@ -0,0 +1,76 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+# SQLite tuning profiles. 'safe' matches SQLite's own defaults.
+STORAGE_PROFILES = {
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000, # negative values are KiB
+        'mmap_size': 0,
+        'busy_timeout': 5000, # ms
+    },
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 256 * 1024 * 1024,
+        'busy_timeout': 5000,
+    },
+}
+
+def get_storage_profile(config):
+    """
+    Gets the pragma settings for the configured storage profile, with any
+    individually configured db_* pragma settings applied on top.
+    """
+    if config.db_profile not in STORAGE_PROFILES:
+        raise ValueError('Unknown storage profile: {}'.format(config.db_profile))
+
+    profile = dict(STORAGE_PROFILES[config.db_profile])
+    for pragma in profile:
+        override = getattr(config, 'db_' + pragma, None)
+        if override is not None:
+            profile[pragma] = override
+    return profile
+
+def create_db_engine(db_file, profile, pool_size = 5, max_overflow = 10, read_only = False):
+    """
+    Creates an engine for the given SQLite file that applies the profile's
+    pragmas to every connection it opens.
+    """
+    engine = create_engine('sqlite:///{}'.format(db_file), echo = False,
+        poolclass = QueuePool, pool_size = pool_size, max_overflow = max_overflow,
+        # pooled connections are handed between the loop and the persistence thread
+        connect_args = {'check_same_thread': False, 'timeout': profile['busy_timeout'] / 1000.0})
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode = {}'.format(profile['journal_mode']))
+        cursor.execute('PRAGMA synchronous = {}'.format(profile['synchronous']))
+        cursor.execute('PRAGMA cache_size = {}'.format(int(profile['cache_size'])))
+        cursor.execute('PRAGMA mmap_size = {}'.format(int(profile['mmap_size'])))
+        cursor.execute('PRAGMA busy_timeout = {}'.format(int(profile['busy_timeout'])))
+        if read_only:
+            cursor.execute('PRAGMA query_only = 1')
+        cursor.close()
+
+    return engine
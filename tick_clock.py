@@ -0,0 +1,126 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from contextlib import contextmanager
+import time
+
+# overrun policies
+CATCH_UP = 'catch_up' # run the missed ticks back to back
+SKIP = 'skip' # drop the missed ticks
+
+class PhaseStats():
+    """Timing statistics for one phase of the game tick."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        self.max = max(self.max, duration)
+
+    def get_average(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+class TickClock():
+    """
+    Game tick clock that targets absolute monotonic deadlines, so the time
+    spent running a tick doesn't push back the ones that follow it.
+    """
+
+    def __init__(self, interval = 1.0, overrun_policy = CATCH_UP, max_catch_up = 60):
+        if overrun_policy not in (CATCH_UP, SKIP):
+            raise ValueError('Unknown tick overrun policy: {}'.format(overrun_policy))
+
+        self._interval = interval
+        self._overrun_policy = overrun_policy
+        self._max_catch_up = max(1, max_catch_up)
+        self._next_deadline = None
+        self._tick_start = None
+
+        self._phases = {} # phase name: PhaseStats
+        self._busy = PhaseStats()
+        self._overruns = 0
+        self._caught_up = 0
+        self._skipped = 0
+
+    def start(self):
+        self._next_deadline = time.monotonic() + self._interval
+
+    async def wait(self):
+        """
+        Sleeps until the next tick deadline.
+        Returns the number of ticks that should be run now, which is more than one
+        when the loop has fallen behind and the policy is to catch up.
+        """
+        # timers can fire up to the clock resolution early, so a tick is
+        # never run until its deadline has really passed
+        now = time.monotonic()
+        while now < self._next_deadline:
+            await asyncio.sleep(self._next_deadline - now)
+            now = time.monotonic()
+
+        self._tick_start = now
+        due = int((now - self._next_deadline) // self._interval) + 1
+        self._next_deadline += due * self._interval
+
+        ticks = 1
+        if due > 1:
+            self._overruns += 1
+            if self._overrun_policy == CATCH_UP:
+                ticks = min(due, self._max_catch_up)
+                self._caught_up += ticks - 1
+            self._skipped += due - ticks
+            print('Game loop is {} tick(s) behind; running {}.'.format(due - 1, ticks))
+
+        return ticks
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager that records how long a phase of the tick takes."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            if name not in self._phases:
+                self._phases[name] = PhaseStats()
+            self._phases[name].record(time.monotonic() - start)
+
+    def end_tick(self):
+        """Records the total time spent working in the tick that just ran."""
+        self._busy.record(time.monotonic() - self._tick_start)
+
+    def get_report(self):
+        """Gets a summary of how close the loop is to its tick budget."""
+        budget_ms = self._interval * 1000
+        lines = []
+        lines.append('Tick budget:      {:.0f} ms ({} policy)'.format(budget_ms, self._overrun_policy))
+        lines.append('Busy:             last {:.1f} ms, avg {:.1f} ms, max {:.1f} ms ({:.1f}% of budget on average)'.format(
+            self._busy.last * 1000, self._busy.get_average() * 1000, self._busy.max * 1000,
+            self._busy.get_average() * 100 / self._interval))
+        for name, stats in self._phases.items():
+            lines.append('  {:<15} last {:.1f} ms, avg {:.1f} ms, max {:.1f} ms'.format(
+                name + ':', stats.last * 1000, stats.get_average() * 1000, stats.max * 1000))
+        lines.append('Overruns:         {}'.format(self._overruns))
+        lines.append('Ticks caught up:  {}'.format(self._caught_up))
+        lines.append('Ticks skipped:    {}'.format(self._skipped))
+        return '\n'.join(lines)
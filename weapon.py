@@ -34,7 +34,7 @@ class WeaponBlueprint(DbModel):
     """
     __tablename__ = 'weapon_blueprint'
     id = Column(Integer, primary_key = True)
-    _name = Column(String)
+    _name = Column(String, index = True, unique = True)
     _description = Column(String)
     _base_damage_dice = Column(String)
 
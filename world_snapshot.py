@@ -0,0 +1,240 @@
+"""
+This file is part of GrindBot.
+
+GrindBot is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+GrindBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with GrindBot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Binary snapshot of every character and the loaded ships they're aboard, so a
+# restart doesn't have to rebuild the world through the ORM.
+#
+# Layout, little endian:
+#  header      HEADER
+#  characters  CHARACTER records
+#  ships       SHIP records
+#  strings     utf-8 text that records refer to by (offset, length)
+# The checksum is a crc32 of everything after the header. The save sequence is the
+# number of the last DB write submitted before the snapshot was taken, so the
+# snapshot matches the DB exactly when the DB's save mark is still that number.
+
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from character import Character, CharacterRow
+import database
+from flight_status import FlightStatus
+import mapper
+from ship import Ship, ShipRow
+
+MAGIC = b'GRNDSNAP'
+VERSION = 2
+
+# magic, version, character count, ship count, created (unix time), save sequence, checksum
+HEADER = struct.Struct('<8sHxxIIqqI')
+# id, xp, credits, tier, mission id, mission ticks, mission started, ship id, owner id, name
+CHARACTER = struct.Struct('<qqqiiiqqIiIi')
+# id, owner id, name, blueprint id, flight status, cargo count
+SHIP = struct.Struct('<qIiIiqii')
+
+# column attributes in record order, strings last
+CHARACTER_COLUMNS = ('id', '_xp', '_credits', '_tier', '_current_mission_id', '_current_mission_ticks',
+    '_current_mission_started', '_current_ship_id', '_owner_id', '_name')
+SHIP_COLUMNS = ('id', '_owner_id', '_name', '_blueprint_id', '_flight_status')
+
+_NONE = -1 # stored in place of None for numbers and string lengths
+
+class Snapshot():
+    """The decoded contents of a snapshot file."""
+
+    def __init__(self, created, sequence, characters, ships):
+        self.created = created
+        self.sequence = sequence # persistence sequence number of the last write before it was taken
+        self.characters = characters # list of tuples in CHARACTER_COLUMNS order
+        self.ships = ships # ship id: tuple in SHIP_COLUMNS order plus the cargo count
+
+class _StringTable():
+    def __init__(self):
+        self._parts = []
+        self._size = 0
+
+    def add(self, text):
+        if text is None:
+            return 0, _NONE
+        data = str(text).encode('utf-8')
+        offset = self._size
+        self._parts.append(data)
+        self._size += len(data)
+        return offset, len(data)
+
+    def to_bytes(self):
+        return b''.join(self._parts)
+
+def _int(value):
+    return _NONE if value is None else value
+
+def encode(characters, sequence):
+    """
+    Encodes the given characters, full or dormant, into snapshot bytes, along
+    with the current ships of those that have them loaded.
+    sequence is the persistence worker's number of the last write submitted.
+    """
+    strings = _StringTable()
+    character_records = []
+    ship_records = []
+
+    for c in characters:
+        ship = c.get_current_ship()
+        character_records.append(CHARACTER.pack(c.id, c._xp, c._credits, _int(c._tier),
+            _int(c._current_mission_id), _int(c._current_mission_ticks), _int(c._current_mission_started),
+            _int(c._current_ship_id), *strings.add(c._owner_id), *strings.add(c._name)))
+        if ship is not None:
+            ship_records.append(SHIP.pack(ship.id, *strings.add(ship._owner_id), *strings.add(ship._name),
+                ship._blueprint_id, _NONE if ship._flight_status is None else ship._flight_status.value,
+                len(ship._cargo)))
+
+    body = b''.join(character_records) + b''.join(ship_records) + strings.to_bytes()
+    header = HEADER.pack(MAGIC, VERSION, len(character_records), len(ship_records),
+        int(time.time()), sequence, zlib.crc32(body))
+    return header + body
+
+def write(path, data):
+    """
+    Writes snapshot bytes, replacing the previous snapshot only once the new one is complete.
+    Returns False if it couldn't be written.
+    """
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print('Unable to write world snapshot {}: {}'.format(path, e))
+        return False
+    return True
+
+def read(path):
+    """
+    Reads and verifies a snapshot file.
+    Returns a Snapshot, or None if there isn't a usable one.
+    """
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+            return _decode(mm)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error) as e:
+        print('Discarding world snapshot {}: {}'.format(path, e))
+        return None
+
+def _decode(mm):
+    if len(mm) < HEADER.size:
+        raise ValueError('truncated header')
+    magic, version, character_count, ship_count, created, sequence, checksum = HEADER.unpack_from(mm)
+    if magic != MAGIC:
+        raise ValueError('not a snapshot file')
+    if version != VERSION:
+        raise ValueError('version {} is not supported'.format(version))
+
+    crc = 0
+    for start in range(HEADER.size, len(mm), 1 << 20):
+        crc = zlib.crc32(mm[start:start + (1 << 20)], crc)
+    if crc != checksum:
+        raise ValueError('checksum mismatch')
+
+    ships_start = HEADER.size + character_count * CHARACTER.size
+    strings_start = ships_start + ship_count * SHIP.size
+    if strings_start > len(mm):
+        raise ValueError('truncated records')
+
+    def text(offset, length):
+        if length == _NONE:
+            return None
+        start = strings_start + offset
+        if start + length > len(mm):
+            raise ValueError('string out of range')
+        return mm[start:start + length].decode('utf-8')
+
+    def number(value):
+        return None if value == _NONE else value
+
+    characters = []
+    for pos in range(HEADER.size, ships_start, CHARACTER.size):
+        r = CHARACTER.unpack_from(mm, pos)
+        characters.append(tuple(number(v) for v in r[:8]) + (text(r[8], r[9]), text(r[10], r[11])))
+
+    ships = {}
+    for pos in range(ships_start, strings_start, SHIP.size):
+        r = SHIP.unpack_from(mm, pos)
+        status = None if r[6] == _NONE else FlightStatus(r[6])
+        ships[r[0]] = (r[0], text(r[1], r[2]), text(r[3], r[4]), r[5], status, r[7])
+
+    return Snapshot(created, sequence, characters, ships)
+
+def restore(snapshot, blueprints):
+    """
+    Rebuilds detached characters and their current ships from a snapshot.
+    Ships that weren't loaded when the snapshot was taken are left for the roster to load.
+    Returns (characters, ids of characters that couldn't be restored and have to be loaded from the DB).
+    """
+    blueprints = {b.id: b for b in blueprints}
+    characters = []
+    skipped = []
+
+    for record in snapshot.characters:
+        ship = None
+        ship_id = record[CHARACTER_COLUMNS.index('_current_ship_id')]
+        if ship_id is not None:
+            ship_record = snapshot.ships.get(ship_id)
+            if ship_record is not None:
+                # cargo isn't part of the snapshot
+                if ship_record[-1] != 0 or ship_record[3] not in blueprints:
+                    skipped.append(record[0])
+                    continue
+                ship = mapper.build(Ship, dict(zip(SHIP_COLUMNS, ship_record)))
+                ship._blueprint = blueprints[ship._blueprint_id]
+
+        c = mapper.build(Character, dict(zip(CHARACTER_COLUMNS, record)))
+        c._current_ship = ship
+        characters.append(c)
+
+    return characters, skipped
+
+def find_stale(snapshot):
+    """
+    Compares a snapshot with the DB row by row. Meant to run in an executor, so it uses its own session.
+    Returns (ids of characters that differ from or are missing in the DB,
+    ids of characters that are only in the DB).
+    """
+    session = database.ReadSession()
+    try:
+        rows = {r[0]: tuple(r) for r in session.query(*[getattr(CharacterRow, c) for c in CHARACTER_COLUMNS])}
+        ship_ids = list(snapshot.ships)
+        ships = {}
+        for i in range(0, len(ship_ids), 500):
+            chunk = ship_ids[i:i + 500]
+            for r in session.query(*[getattr(ShipRow, c) for c in SHIP_COLUMNS]).filter(ShipRow.id.in_(chunk)):
+                ships[r[0]] = tuple(r)
+    finally:
+        session.close()
+
+    ship_index = CHARACTER_COLUMNS.index('_current_ship_id')
+    stale = []
+    for record in snapshot.characters:
+        ship_id = record[ship_index]
+        if rows.pop(record[0], None) != record:
+            stale.append(record[0])
+        elif ship_id in snapshot.ships and ships.get(ship_id) != snapshot.ships[ship_id][:-1]:
+            stale.append(record[0])
+    return stale, list(rows)